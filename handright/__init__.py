@@ -22,16 +22,38 @@ is the auxiliary parameter class. The return value of `handwrite` is an
 `Iterable` of Pillow `Image`, so the images can be shown, saved, or further
 processed.
 """
-from handright._core import handwrite
+from handright._async import ahandwrite
+from handright._core import handwrite, handwrite_many, paginate, Session
+from handright._core import Manuscript
 from handright._exceptions import Error, LayoutError, BackgroundTooLargeError
-from handright._template import Template, Feature
+from handright._glyph import GlyphCache
+from handright._index import PageIndex, render_page, render_pages
+from handright._sinks import save_pdf, save_tiff, save_pngs
+from handright._template import Template, CompiledTemplate, Feature
+from handright._util import PageStats, PageLayout, BufferPool
 
 __version__ = "8.2.0"
 
 __all__ = (
     "handwrite",
+    "ahandwrite",
+    "handwrite_many",
+    "paginate",
+    "PageIndex",
+    "render_page",
+    "render_pages",
+    "save_pdf",
+    "save_tiff",
+    "save_pngs",
+    "Session",
+    "Manuscript",
     "Template",
+    "CompiledTemplate",
     "Feature",
+    "GlyphCache",
+    "PageStats",
+    "PageLayout",
+    "BufferPool",
     "Error",
     "LayoutError",
     "BackgroundTooLargeError"
@@ -0,0 +1,56 @@
+# coding: utf-8
+import asyncio
+import collections
+import concurrent.futures
+
+from handright._core import _draft, _hash_seed, _Renderer, _to_templates
+from handright._glyph import *
+from handright._template import *
+from handright._util import *
+
+
+async def ahandwrite(
+        text: Union[str, Iterable[str]],
+        template: Union[Template, Sequence[Template]],
+        seed: Hashable = None,
+        executor: Optional[concurrent.futures.Executor] = None,
+        glyph_cache: Optional[GlyphCache] = None,
+        prefetch: int = 1,
+) -> AsyncIterator[PIL.Image.Image]:
+    """The asynchronous version of `handright.handwrite`, which returns an
+    asynchronous Iterator of Pillow's Images without blocking the event loop.
+
+    The pages are drafted in the default executor of the running event loop
+    one by one, and rendered in `executor`, which defaults to the default
+    executor as well. At most `prefetch` pages are drafted and rendered ahead
+    of the consumer, so a slow consumer holds back the drafting and rendering.
+
+    Closing the Iterator, e.g. breaking out of the `async for` loop, or
+    cancelling the consumer cancels the pages which are not being rendered.
+
+    The outputs are the same as the ones of `handright.handwrite` with the same
+    arguments.
+    """
+    templates = _to_templates(template)
+    pages = _draft(text, templates, seed, glyph_cache)
+    renderer = _Renderer(templates)
+    hashed_seed = _hash_seed(seed)
+    loop = asyncio.get_running_loop()
+    rendering = collections.deque()
+    drafted_all = False
+    try:
+        while True:
+            while not drafted_all and len(rendering) <= prefetch:
+                page = await loop.run_in_executor(None, next, pages, None)
+                if page is None:
+                    drafted_all = True
+                    break
+                rendering.append(loop.run_in_executor(
+                    executor, renderer.render, page, hashed_seed
+                ))
+            if not rendering:
+                return
+            yield await rendering.popleft()
+    finally:
+        for future in rendering:
+            future.cancel()
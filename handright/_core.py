@@ -1,8 +1,22 @@
 # coding: utf-8
+import array
+import bisect
+import collections
+import heapq
 import itertools
 import math
+import time
+
+import PIL.ImageChops
+
+try:
+    import numpy
+except ImportError:  # NumPy is optional, fall back to the pure Python way
+    numpy = None
 
 from handright._exceptions import *
+from handright._glyph import *
+from handright._parallel import *
 from handright._template import *
 from handright._util import *
 
@@ -17,19 +31,41 @@ _CR = "\r"
 _CRLF = "\r\n"
 
 _UNSIGNED_INT32_TYPECODE = "L"
-_MAX_INT16_VALUE = 0xFFFF
-_STROKE_END = 0xFFFFFFFF
+_INT32_TYPECODE = "i"
+
+# The pages are labelled and the ink is composited in tiles of about this number
+# of pixels, which bounds the memory used by the large pages.
+_TILE_PIXELS = 1 << 24
+# At most this number of bands of the ink mask are allocated at once
+_MAX_MASK_BANDS = 2
+# PIL.Image.Dither.NONE, which is missing before Pillow 9.1
+_NO_DITHER = 0
+
+_DEFAULT_GLYPH_CACHE = GlyphCache()
+_DEFAULT_ADVANCE_CACHE = AdvanceCache()
 
 
 def handwrite(
-        text: str,
+        text: Union[str, Iterable[str]],
         template: Union[Template, Sequence[Template]],
         seed: Hashable = None,
         mapper: Callable[[Callable, Iterable], Iterable] = map,
-) -> Iterable[PIL.Image.Image]:
+        glyph_cache: Optional[GlyphCache] = None,
+        prefetch: int = 0,
+        workers: Optional[int] = None,
+        shared_memory: bool = False,
+        on_stats: Optional[Callable[[PageStats], Any]] = None,
+        buffer_pool: Optional[BufferPool] = None,
+        parallel_drafting: bool = False,
+        max_in_flight: Optional[int] = None,
+        ordered: bool = True,
+) -> Iterable:
     """Handwrite `text` with the configurations in `template`, and return an
     Iterable of Pillow's Images.
 
+    `text` could be a str or an Iterable of str chunks, e.g. a text file object.
+    The chunks are read lazily while drafting the pages.
+
     `template` could be a Template instance or a Sequence of Template
     instances. If pass a Template Sequence, the inside Template instances will
     be applied cyclically to the output pages.
@@ -40,138 +76,787 @@ def handwrite(
     Iterable though) could be passed to `mapper` to boost the page rendering
     process, e.g. `multiprocessing.Pool.map`.
 
-    Throw BackgroundTooLargeError, if the width or height of `background` in
-    `template` exceeds 65,534.
+    Alternatively, pass the number of processes to `workers` to render the
+    pages in a process pool owned by the returned Iterator, which is closed
+    once the iteration ends. The templates are sent to each process only once,
+    and the outputs are the same as the ones of the serial rendering. `mapper`
+    is ignored if `workers` is given. Turn on `shared_memory` to transfer the
+    drafted pages and the rendered images between the processes through shared
+    memory instead of pickling them, which pays off for large backgrounds.
+    The pages are drafted lazily, and at most `max_in_flight` pages, which
+    defaults to twice the number of processes, are drafted or being rendered
+    but not yet consumed, so the images are yielded as soon as they are ready
+    and the memory does not grow with the number of pages.
+
+    If `ordered` is False, the returned Iterable yields (page index, image)
+    pairs instead, in the order of completion if `workers` is given, which
+    lets a consumer that does not need the order avoid waiting for slow pages.
+
+    The rasterized chars are cached in `glyph_cache`, which defaults to a cache
+    shared by all the calls.
+
+    If `prefetch` is positive, the pages will be drafted in a background thread
+    ahead of the rendering, and at most `prefetch` drafted pages are kept
+    waiting for `mapper`.
+
+    If `on_stats` is given, the PageStats of each page are recorded and passed
+    to it once the page is rendered, which slows down the handwriting slightly.
+    It is called in the rendering process, so it must be picklable if `mapper`
+    renders the pages in other processes. With `workers`, it is called in the
+    current process instead.
+
+    If `buffer_pool` is given, the bitmaps of the drafted pages and the output
+    images released to it are reused instead of allocating new ones, as long as
+    the pages are rendered in the current process.
+
+    If `parallel_drafting` is True and `workers` is given, the pages are drafted
+    in the process pool along with the rendering. The current process only lays
+    out the text without drawing it, which is much faster than drafting, and
+    sends each page with its text and the random state of drafting at its start
+    to the pool. The outputs are still the same as the ones of the serial
+    handwriting. The pages are drafted with the glyph caches of the workers,
+    so `glyph_cache`, `shared_memory` and `buffer_pool` must not be given.
+
     Throw LayoutError, if the settings are conflicting, which makes it
-    impossible to layout the `text`.
+    impossible to layout the `text`. Throw ValueError, if an option is given
+    without the ones it depends on, or with the ones it excludes.
+    """
+    _check_options(
+        workers, shared_memory, parallel_drafting, max_in_flight, glyph_cache,
+        buffer_pool,
+    )
+    templates = _to_templates(template)
+    if parallel_drafting:
+        tasks = _layout_tasks(text, templates, seed, on_stats is not None)
+        if prefetch > 0:
+            tasks = iterate_in_thread(tasks, prefetch)
+        return imap_drafts_in_pool(
+            (_Renderer(templates),), tasks, workers, on_stats, max_in_flight,
+            ordered,
+        )
+    if glyph_cache is None:
+        glyph_cache = _DEFAULT_GLYPH_CACHE
+    pages = _draft(
+        text, templates, seed, glyph_cache, on_stats is not None,
+        buffers=buffer_pool,
+    )
+    if prefetch > 0:
+        pages = iterate_in_thread(pages, prefetch)
+    if workers is not None:
+        tasks = zip(
+            itertools.repeat(0), itertools.repeat(_hash_seed(seed)), pages
+        )
+        return imap_in_pool(
+            (_Renderer(templates),), tasks, workers, shared_memory, on_stats,
+            max_in_flight, ordered,
+        )
+    images = mapper(_Renderer(templates, seed, on_stats, buffer_pool), pages)
+    return images if ordered else enumerate(images)
+
+
+def _check_options(
+        workers, shared_memory, parallel_drafting, max_in_flight, glyph_cache,
+        buffer_pool,
+) -> None:
+    """Throws ValueError for the options of handwrite() that would be ignored.
+    """
+    if workers is None:
+        if parallel_drafting:
+            raise ValueError("parallel_drafting requires workers")
+        if shared_memory:
+            raise ValueError("shared_memory requires workers")
+        if max_in_flight is not None:
+            raise ValueError("max_in_flight requires workers")
+    if parallel_drafting:
+        if shared_memory:
+            raise ValueError("parallel_drafting excludes shared_memory")
+        if glyph_cache is not None:
+            raise ValueError("parallel_drafting excludes glyph_cache")
+        if buffer_pool is not None:
+            raise ValueError("parallel_drafting excludes buffer_pool")
+
+
+def _layout_tasks(
+        text, templates, seed, stats: bool
+) -> Iterator[Tuple[int, Optional[int], int, str, tuple, bool]]:
+    """Lays out the text page by page, and yields the (renderer index, hashed
+    seed, page number, text of the page, random state, stats) tasks of drafting
+    and rendering each page from its start, see `_Renderer.draft_and_render`.
+    """
+    hashed_seed = _hash_seed(seed)
+    text = _TextStream((text,) if isinstance(text, str) else text)
+    rand = random.Random(x=seed)
+    start = 0
+    for num in itertools.count():
+        if text.ends_at(start):
+            return
+        state = rand.getstate()
+        _, end = _draft_page(text, start, templates, num, rand, layout=True)
+        yield 0, hashed_seed, num, text.slice(start, end), state, stats
+        start = end
+
+
+def handwrite_many(
+        jobs: Iterable[Tuple[
+            Union[str, Iterable[str]],
+            Union[Template, Sequence[Template]],
+            Hashable,
+        ]],
+        glyph_cache: Optional[GlyphCache] = None,
+        workers: Optional[int] = None,
+        shared_memory: bool = False,
+) -> Iterator[Tuple[int, int, PIL.Image.Image]]:
+    """Handwrite many documents in one call, and return an Iterator of
+    (job id, page index, image) tuples in order.
+
+    Each of `jobs` is a (text, template, seed) tuple, whose items are the same
+    as the arguments of `handright.handwrite`. The job id is the index of the
+    job in `jobs`, and the page index counts from 0 within each job. The
+    outputs of each job are the same as the ones of `handright.handwrite`.
+
+    The jobs sharing the same templates, i.e. the same Template instances in the
+    same order, share the same prepared templates. `jobs` is read at once to
+    collect the templates, while the texts are still read lazily.
+
+    If `workers` is given, the pages of all the jobs are rendered in a process
+    pool of `workers` processes, which is closed once the iteration ends, so
+    that the short jobs do not leave the processes idle. The templates are sent
+    to each process only once. `glyph_cache` and `shared_memory` are the same
+    as the ones of `handright.handwrite`.
+
+    Throw LayoutError, if the settings are conflicting, which makes it
+    impossible to layout the text of some job.
     """
-    if isinstance(template, Template):
-        templates = (template,)
+    jobs = list(jobs)
+    indices = {}
+    renderers = []
+    for _, template, _ in jobs:
+        key = _templates_key(template)
+        if key not in indices:
+            indices[key] = len(renderers)
+            renderers.append(_Renderer(_to_templates(template)))
+    tags = collections.deque()  # (job id, page index) of the drafted pages
+
+    def draft_jobs():
+        for job_id, (text, template, seed) in enumerate(jobs):
+            index = indices[_templates_key(template)]
+            templates = renderers[index].get_templates()
+            hashed_seed = _hash_seed(seed)
+            for page in _draft(text, templates, seed, glyph_cache):
+                tags.append((job_id, page.num))
+                yield index, hashed_seed, page
+
+    if workers is None:
+        images = (renderers[i].render(p, s) for i, s, p in draft_jobs())
     else:
-        templates = template
-    pages = _draft(text, templates, seed)
-    renderer = _Renderer(templates, seed)
-    return mapper(renderer, pages)
+        images = imap_in_pool(renderers, draft_jobs(), workers, shared_memory)
+    for image in images:
+        job_id, page_index = tags.popleft()
+        yield job_id, page_index, image
+
+
+class Session(object):
+    """A long-lived context of handwriting with the same templates.
+
+    A Session keeps the prepared templates, the cached glyphs and font variants,
+    and optionally a process pool alive across calls, so that each call of
+    `Session.handwrite` only pays for drafting and rendering its own pages.
+    Close the Session, or use it as a context manager, to shut down the process
+    pool.
+
+    A minimal example:
+    ```
+    with Session(template, workers=4) as session:
+        for text in texts:
+            images = session.handwrite(text, seed=...)
+    ```
+    """
+
+    __slots__ = (
+        "_templates", "_renderer", "_glyph_cache", "_pool", "_buffer_pool"
+    )
+
+    def __init__(
+            self,
+            template: Union[Template, Sequence[Template]],
+            workers: Optional[int] = None,
+            glyph_cache: Optional[GlyphCache] = None,
+            shared_memory: bool = False,
+            buffer_pool: Optional[BufferPool] = None,
+            max_in_flight: Optional[int] = None,
+    ) -> None:
+        """`template` is the same as the one of `handright.handwrite`. The
+        templates are compiled, so the later changes of them do not affect the
+        Session.
+
+        If `workers` is given, the pages will be rendered in a process pool of
+        `workers` processes which is owned by the Session. `shared_memory` and
+        `max_in_flight` are the same as the ones of `handright.handwrite`.
+
+        The rasterized chars are cached in `glyph_cache`, which defaults to a
+        new GlyphCache owned by the Session. `buffer_pool` is the same as the
+        one of `handright.handwrite`.
+
+        Throw ValueError, if `shared_memory` or `max_in_flight` is given without
+        `workers`.
+        """
+        _check_options(
+            workers, shared_memory, False, max_in_flight, None, None
+        )
+        self._templates = _to_templates(template)
+        self._buffer_pool = buffer_pool
+        self._renderer = _Renderer(
+            self._templates, buffers=None if workers else buffer_pool
+        )
+        if glyph_cache is None:
+            glyph_cache = GlyphCache()
+        self._glyph_cache = glyph_cache
+        self._pool = None
+        if workers is not None:
+            self._pool = RenderPool(
+                (self._renderer,), workers, shared_memory, max_in_flight
+            )
+
+    def handwrite(
+            self,
+            text: Union[str, Iterable[str]],
+            seed: Hashable = None,
+            ordered: bool = True,
+    ) -> Iterable:
+        """Handwrite `text` with the templates of the Session, and return an
+        Iterable of Pillow's Images, or (page index, image) pairs if `ordered`
+        is False. The outputs are the same as the ones of
+        `handright.handwrite` with the same arguments."""
+        pages = _draft(
+            text, self._templates, seed, self._glyph_cache,
+            buffers=self._buffer_pool if self._pool is None else None,
+        )
+        hashed_seed = _hash_seed(seed)
+        if self._pool is None:
+            images = (self._renderer.render(p, hashed_seed) for p in pages)
+            return images if ordered else enumerate(images)
+        return self._pool.imap(pages, hashed_seed, ordered=ordered)
+
+    def glyph_cache(self) -> GlyphCache:
+        return self._glyph_cache
+
+    def close(self) -> None:
+        """Shuts down the process pool if any. The Session is unusable after
+        that."""
+        if self._pool is not None:
+            self._pool.close()
+            self._pool = None
+
+    def __enter__(self) -> "Session":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+
+class Manuscript(object):
+    """A text handwritten incrementally, e.g. for previewing a text being
+    edited.
+
+    Each call of `Manuscript.handwrite` keeps the start index and the random
+    state of each page. The next call only redrafts and rerenders the pages
+    from the first page touched by the edit, and reuses the rest of the old
+    pages once the pagination converges with the old one, i.e. a new page
+    starts at the same char of the unchanged text in the same random state.
+
+    The random states only converge if the edit does not change the number of
+    the chars placed since the edit, e.g. replacing chars, or if all the sigmas
+    of the layout are zero. Otherwise, all the pages after the edit are
+    redrafted.
+    """
+
+    __slots__ = (
+        "_templates",
+        "_seed",
+        "_renderer",
+        "_glyph_cache",
+        "_text",
+        "_starts",
+        "_states",
+        "_images",
+    )
+
+    def __init__(
+            self,
+            template: Union[Template, Sequence[Template]],
+            seed: Hashable = None,
+            glyph_cache: Optional[GlyphCache] = None,
+    ) -> None:
+        """`template` and `seed` are the same as the ones of
+        `handright.handwrite`. The templates are compiled, so the later changes
+        of them do not affect the Manuscript.
+
+        The rasterized chars are cached in `glyph_cache`, which defaults to a
+        new GlyphCache owned by the Manuscript.
+        """
+        self._templates = _to_templates(template)
+        self._seed = seed
+        self._renderer = _Renderer(self._templates, seed)
+        if glyph_cache is None:
+            glyph_cache = GlyphCache()
+        self._glyph_cache = glyph_cache
+        self._text = ""
+        self._starts = []  # the start index of each page
+        self._states = []  # the random state of drafting at each page start
+        self._images = []
+
+    def handwrite(self, text: str) -> List[PIL.Image.Image]:
+        """Handwrite `text`, and return the list of the images of all the
+        pages, which are the same as the outputs of `handright.handwrite` with
+        the same arguments. The images of the untouched pages are the same
+        objects as the ones returned before, so they should not be modified in
+        place.
+
+        Throw LayoutError, if the settings are conflicting, which makes it
+        impossible to layout the `text`.
+        """
+        text = _preprocess_text(text)
+        old = self._text
+        prefix = _common_prefix_length(old, text)
+        if prefix == len(old) == len(text):
+            return list(self._images)
+        suffix = _common_suffix_length(old, text, prefix)
+        # the old chars from old_end are unchanged, and shifted by delta
+        old_end = len(old) - suffix
+        delta = len(text) - len(old)
+
+        # the first page whose layout might be affected, which reads the char
+        # right after its own chars to break lines
+        num = bisect.bisect_left(self._starts, prefix) - 1
+        num = max(num, 0)
+        if num < len(self._starts):
+            start = self._starts[num]
+            rand = random.Random()
+            rand.setstate(self._states[num])
+        else:
+            start = 0
+            rand = random.Random(x=self._seed)
+        starts = self._starts[:num]
+        states = self._states[:num]
+        images = self._images[:num]
+
+        stream = _TextStream((text,))
+        hashed_seed = _hash_seed(self._seed)
+        while not stream.ends_at(start):
+            state = rand.getstate()
+            if self._converges(num, start, state, old_end, delta):
+                starts.extend(s + delta for s in self._starts[num:])
+                states.extend(self._states[num:])
+                images.extend(self._images[num:])
+                break
+            starts.append(start)
+            states.append(state)
+            page, start = _draft_page(
+                stream, start, self._templates, num, rand, self._glyph_cache
+            )
+            images.append(self._renderer.render(page, hashed_seed))
+            num += 1
+
+        self._text = text
+        self._starts = starts
+        self._states = states
+        self._images = images
+        return list(images)
+
+    def _converges(self, num, start, state, old_end, delta) -> bool:
+        """Returns True if the old page numbered `num` is the same as the new
+        page starting at `start` in `state`."""
+        if num >= len(self._starts):
+            return False
+        old_start = self._starts[num]
+        return (old_start >= old_end
+                and old_start + delta == start
+                and self._states[num] == state)
+
+    def get_text(self) -> str:
+        """Returns the last text handwritten, in which all the line separators
+        are replaced by "\\n"."""
+        return self._text
+
+    def glyph_cache(self) -> GlyphCache:
+        return self._glyph_cache
+
+
+def paginate(
+        text: Union[str, Iterable[str]],
+        template: Union[Template, Sequence[Template]],
+        seed: Hashable = None,
+) -> Iterator[PageLayout]:
+    """Layout `text` as `handright.handwrite` does without rasterizing or
+    rendering anything, and return an Iterator of the PageLayouts of the pages,
+    which is much faster than handwriting the text.
+
+    The arguments are the same as the ones of `handright.handwrite`, and the
+    pages are broken in the same way as `handright.handwrite` with the same
+    arguments does.
+
+    Throw LayoutError, if the settings are conflicting, which makes it
+    impossible to layout the `text`.
+    """
+    for page in _draft(text, _to_templates(template), seed, layout=True):
+        yield PageLayout(
+            page.num, page.lines[0][0], page.lines[-1][1], page.lines
+        )
+
+
+def _to_templates(
+        template: Union[TemplateLike, Sequence[TemplateLike]]
+) -> Tuple[CompiledTemplate, ...]:
+    if isinstance(template, (Template, CompiledTemplate)):
+        template = (template,)
+    return tuple(map(_compile, template))
 
 
-def _draft(text, templates, seed=None) -> Iterator[Page]:
-    text = _preprocess_text(text)
-    template_iter = itertools.cycle(templates)
-    num_iter = itertools.count()
+def _compile(template: TemplateLike) -> CompiledTemplate:
+    if isinstance(template, CompiledTemplate):
+        return template
+    return template.compile()
+
+
+def _templates_key(templates: Sequence[TemplateLike]) -> Tuple[int, ...]:
+    # Template is unhashable, and the templates are kept alive by the jobs
+    if isinstance(templates, (Template, CompiledTemplate)):
+        templates = (templates,)
+    return tuple(map(id, templates))
+
+
+def _draft(
+        text,
+        templates,
+        seed=None,
+        glyphs: Optional[GlyphCache] = None,
+        stats: bool = False,
+        layout: bool = False,
+        buffers: Optional[BufferPool] = None,
+) -> Iterator[Page]:
+    """Yields the drafted pages. If `layout` is True, only the layouts of the
+    pages are recorded in the lines of the pages, and nothing is drawn. The
+    bitmaps of the pages are taken from `buffers` if possible."""
+    templates = _to_templates(templates)
+    text = _TextStream((text,) if isinstance(text, str) else text)
     rand = random.Random(x=seed)
     start = 0
-    while start < len(text):
-        template = next(template_iter)
-        page = Page(_INTERNAL_MODE, template.get_size(), _BLACK, next(num_iter))
-        start = _draw_page(page, text, start, template, rand)
+    for num in itertools.count():
+        if text.ends_at(start):
+            return
+        page, start = _draft_page(
+            text, start, templates, num, rand, glyphs, stats, layout, buffers
+        )
         yield page
 
 
+def _draft_page(
+        text,
+        start: int,
+        templates,
+        num: int,
+        rand: random.Random,
+        glyphs: Optional[GlyphCache] = None,
+        stats: bool = False,
+        layout: bool = False,
+        buffers: Optional[BufferPool] = None,
+) -> Tuple[Page, int]:
+    """Drafts the page numbered `num` from the `start` index of the _TextStream
+    `text`, and returns the page and the start index of the next page. The
+    arguments are the same as the ones of _draft."""
+    text.release(start)
+    template = _get_template(templates, num)
+    if layout:
+        glyphs = _DEFAULT_ADVANCE_CACHE
+        page = _LayoutPage(template.size, num)
+        page.lines = []
+    else:
+        if glyphs is None:
+            glyphs = _DEFAULT_GLYPH_CACHE
+        page = _new_page(template.size, num, buffers)
+        page.boxes = []
+        if template.glyph_strokes:
+            page.glyphs = []
+    if not stats:
+        return page, _draw_page(page, text, start, template, rand, glyphs)
+    page.stats = PageStats(num)
+    misses = template.get_font_variant_info().misses
+    begin = time.perf_counter()
+    start = _draw_page(page, text, start, template, rand, glyphs)
+    page.stats.layout_time = (time.perf_counter() - begin
+                              - page.stats.glyph_time)
+    page.stats.font_variants = (template.get_font_variant_info().misses
+                                - misses)
+    return page, start
+
+
+def _common_prefix_length(text1: str, text2: str) -> int:
+    low, high = 0, min(len(text1), len(text2))
+    # text1[:low] == text2[:low], and the length is at most high
+    while low < high:
+        mid = (low + high + 1) // 2
+        if text1[low:mid] == text2[low:mid]:
+            low = mid
+        else:
+            high = mid - 1
+    return low
+
+
+def _common_suffix_length(text1: str, text2: str, prefix: int) -> int:
+    """Returns the length of the common suffix, which does not overlap the
+    common prefix of length `prefix`."""
+    length = _common_prefix_length(text1[::-1], text2[::-1])
+    return min(length, len(text1) - prefix, len(text2) - prefix)
+
+
+def _new_page(
+        size: Tuple[int, int], num: int, buffers: Optional[BufferPool]
+) -> Page:
+    if buffers is not None:
+        image = buffers.acquire_draft(_INTERNAL_MODE, size)
+        if image is not None:
+            return Page.from_image(image, num)
+    return Page(_INTERNAL_MODE, size, _BLACK, num)
+
+
+def _release_page(page, buffers: BufferPool) -> None:
+    """Resets the ink of the drafted page, and releases its bitmap to
+    buffers."""
+    if page.boxes:
+        box = (max(min(b[0] for b in page.boxes), 0),
+               max(min(b[1] for b in page.boxes), 0),
+               min(max(b[2] for b in page.boxes), page.width()),
+               min(max(b[3] for b in page.boxes), page.height()))
+        if box[0] < box[2] and box[1] < box[3]:
+            page.image.paste(_BLACK, box)
+    buffers.release_draft(page.image)
+    page.image = None
+
+
+def _new_canvas(
+        background: PIL.Image.Image, buffers: Optional[BufferPool]
+) -> PIL.Image.Image:
+    """Returns a copy of background, which reuses a canvas in buffers if
+    possible."""
+    # the palettes are not reset by pasting
+    if buffers is None or background.palette is not None:
+        return background.copy()
+    canvas = buffers.acquire_canvas(background.mode, background.size)
+    if canvas is None:
+        return background.copy()
+    canvas.paste(background)
+    canvas.info = background.info.copy()
+    return canvas
+
+
+class _LayoutPage(Page):
+    """A page without pixels, onto which the glyphs without ink are drawn."""
+
+    __slots__ = ("_size",)
+
+    def __init__(self, size: Tuple[int, int], num: int) -> None:
+        self.image = None
+        self.num = num
+        self.glyphs = None
+        self.boxes = None
+        self.stats = None
+        self.lines = None
+        self._size = size
+
+    def size(self) -> Tuple[int, int]:
+        return self._size
+
+    def width(self) -> int:
+        return self._size[0]
+
+    def height(self) -> int:
+        return self._size[1]
+
+
 def _preprocess_text(text: str) -> str:
     return text.replace(_CRLF, _LF).replace(_CR, _LF)
 
 
-def _check_template(page, tpl) -> None:
-    if page.height() < (tpl.get_top_margin() + tpl.get_line_spacing()
-                        + tpl.get_bottom_margin()):
+class _TextStream(object):
+    """The preprocessed text read from str chunks lazily, which drops the
+    released chars once they outnumber the kept ones."""
+
+    __slots__ = ("_chunks", "_buffer", "_offset", "_released", "_pending_cr")
+
+    def __init__(self, chunks: Iterable[str]) -> None:
+        self._chunks = iter(chunks)
+        self._buffer = ""
+        self._offset = 0  # the index of the first char in _buffer
+        self._released = 0  # the chars before this index are released
+        # a CR at the end of a chunk may be the first half of a CRLF
+        self._pending_cr = False
+
+    def __getitem__(self, index: int) -> str:
+        """Returns the char at index, which must not have been released. Throw
+        IndexError, if index is out of the text."""
+        assert index >= self._released
+        index -= self._offset
+        while index >= len(self._buffer):
+            if not self._read():
+                raise IndexError("text index out of range")
+        return self._buffer[index]
+
+    def ends_at(self, index: int) -> bool:
+        try:
+            self[index]
+        except IndexError:
+            return True
+        return False
+
+    def slice(self, start: int, end: int) -> str:
+        """Returns the chars from start to end, which must have been read and
+        not released."""
+        return self._buffer[start - self._offset:end - self._offset]
+
+    def release(self, index: int) -> None:
+        """Discards the chars before index."""
+        while index - self._offset > len(self._buffer) and self._read():
+            pass
+        self._released = index
+        # compacts only when it copies fewer chars than it drops, so that the
+        # cost is amortized linear in the length of the text
+        released = index - self._offset
+        if released > len(self._buffer) - released:
+            self._buffer = self._buffer[released:]
+            self._offset = index
+
+    def _read(self) -> bool:
+        """Appends the next non-empty chunk to the buffer, and returns False if
+        there are no more chunks."""
+        for chunk in self._chunks:
+            if self._pending_cr:
+                chunk = _CR + chunk
+            self._pending_cr = chunk.endswith(_CR)
+            if self._pending_cr:
+                chunk = chunk[:-1]
+            if chunk:
+                self._buffer += _preprocess_text(chunk)
+                return True
+        if self._pending_cr:
+            self._pending_cr = False
+            self._buffer += _LF
+            return True
+        return False
+
+
+def _check_template(page, tpl: CompiledTemplate) -> None:
+    if page.height() < tpl.top_margin + tpl.line_spacing + tpl.bottom_margin:
         msg = "for (height < top_margin + line_spacing + bottom_margin)"
         raise LayoutError(msg)
-    if tpl.get_font().size > tpl.get_line_spacing():
+    if tpl.font_size > tpl.line_spacing:
         msg = "for (font.size > line_spacing)"
         raise LayoutError(msg)
-    if page.width() < (tpl.get_left_margin() + tpl.get_font().size
-                       + tpl.get_right_margin()):
+    if page.width() < tpl.left_margin + tpl.font_size + tpl.right_margin:
         msg = "for (width < left_margin + font.size + right_margin)"
         raise LayoutError(msg)
-    if tpl.get_word_spacing() <= -tpl.get_font().size // 2:
+    if tpl.word_spacing <= -tpl.font_size // 2:
         msg = "for (word_spacing <= -font.size // 2)"
         raise LayoutError(msg)
 
 
 def _draw_page(
-        page, text, start: int, tpl: Template, rand: random.Random
+        page,
+        text,
+        start: int,
+        tpl: CompiledTemplate,
+        rand: random.Random,
+        glyphs: GlyphCache,
 ) -> int:
     _check_template(page, tpl)
 
-    width = page.width()
-    height = page.height()
-    top_margin = tpl.get_top_margin()
-    bottom_margin = tpl.get_bottom_margin()
-    left_margin = tpl.get_left_margin()
-    right_margin = tpl.get_right_margin()
-    line_spacing = tpl.get_line_spacing()
-    font_size = tpl.get_font().size
-    start_chars = tpl.get_start_chars()
-    end_chars = tpl.get_end_chars()
-
-    draw = page.draw()
-    y = top_margin + line_spacing - font_size
-    while y <= height - bottom_margin - font_size:
+    left_margin = tpl.left_margin
+    line_spacing = tpl.line_spacing
+    last_line_y = tpl.last_line_y
+    start_chars_x = tpl.start_chars_x
+    end_chars_x = tpl.end_chars_x
+    start_chars = tpl.start_chars
+    end_chars = tpl.end_chars
+    grid_layout = tpl.grid_layout
+
+    y = tpl.first_line_y
+    while y <= last_line_y:
+        line_start = start
         x = left_margin
         while True:
-            if text[start] == _LF:
+            char = text[start]
+            if char == _LF:
                 start += 1
-                if start == len(text):
-                    return start
                 break
-            if (x > width - right_margin - 2 * font_size
-                    and text[start] in start_chars):
+            if x > start_chars_x and char in start_chars:
                 break
-            if (x > width - right_margin - font_size
-                    and text[start] not in end_chars):
+            if x > end_chars_x and char not in end_chars:
                 break
-            if Feature.GRID_LAYOUT in tpl.get_features():
-                x = _grid_layout(draw, x, y, text[start], tpl, rand)
+            if grid_layout:
+                x = _grid_layout(page, x, y, char, tpl, rand, glyphs)
             else:
-                x = _flow_layout(draw, x, y, text[start], tpl, rand)
+                x = _flow_layout(page, x, y, char, tpl, rand, glyphs)
             start += 1
-            if start == len(text):
-                return start
+            if text.ends_at(start):
+                break
+        if page.lines is not None:
+            page.lines.append((line_start, start, y))
+        if text.ends_at(start):
+            return start
         y += line_spacing
     return start
 
 
 def _flow_layout(
-        draw, x, y, char, tpl: Template, rand: random.Random
+        page, x, y, char, tpl: CompiledTemplate, rand: random.Random, glyphs
 ) -> float:
-    xy = (round(x), round(gauss(rand, y, tpl.get_line_spacing_sigma())))
+    xy = (round(x), round(gauss(rand, y, tpl.line_spacing_sigma)))
     font = _get_font(tpl, rand)
-    offset = _draw_char(draw, char, xy, font)
-    x += gauss(
-        rand,
-        tpl.get_word_spacing() + offset,
-        tpl.get_word_spacing_sigma()
-    )
+    offset = _draw_char(page, char, xy, font, glyphs)
+    x += gauss(rand, tpl.word_spacing + offset, tpl.word_spacing_sigma)
     return x
 
 
 def _grid_layout(
-        draw, x, y, char, tpl: Template, rand: random.Random
+        page, x, y, char, tpl: CompiledTemplate, rand: random.Random, glyphs
 ) -> float:
-    xy = (round(gauss(rand, x, tpl.get_word_spacing_sigma())),
-          round(gauss(rand, y, tpl.get_line_spacing_sigma())))
+    xy = (round(gauss(rand, x, tpl.word_spacing_sigma)),
+          round(gauss(rand, y, tpl.line_spacing_sigma)))
     font = _get_font(tpl, rand)
-    _ = _draw_char(draw, char, xy, font)
-    x += tpl.get_word_spacing() + tpl.get_font().size
+    _ = _draw_char(page, char, xy, font, glyphs)
+    x += tpl.grid_step
     return x
 
 
-def _get_font(tpl: Template, rand: random.Random):
-    font = tpl.get_font()
+def _get_font(tpl: CompiledTemplate, rand: random.Random):
     actual_font_size = max(round(
-        gauss(rand, font.size, tpl.get_font_size_sigma())
+        gauss(rand, tpl.font_size, tpl.font_size_sigma)
     ), 0)
-    if actual_font_size != font.size:
-        return font.font_variant(size=actual_font_size)
-    return font
+    return tpl.get_font_variant(actual_font_size)
 
 
-def _draw_char(draw, char: str, xy: Tuple[int, int], font) -> int:
+def _draw_char(page, char: str, xy: Tuple[int, int], font, glyphs) -> int:
     """Draws a single char with the parameters and white color, and returns the
     offset."""
-    draw.text(xy, char, fill=_WHITE, font=font)
-    left, top, right, bottom = font.getbbox(char)
-    return right - left
+    if page.stats is None:
+        return _draw_glyph(page, char, xy, font, glyphs)
+    begin = time.perf_counter()
+    advance = _draw_glyph(page, char, xy, font, glyphs)
+    page.stats.glyph_time += time.perf_counter() - begin
+    page.stats.chars += 1
+    return advance
+
+
+def _draw_glyph(page, char: str, xy: Tuple[int, int], font, glyphs) -> int:
+    glyph = glyphs.get(font, char)
+    glyph.paste(page.image, xy)
+    if glyph.mask is None:
+        return glyph.advance
+    if page.boxes is not None:
+        x, y = glyph.position(xy)
+        page.boxes.append((x, y, x + glyph.mask.width, y + glyph.mask.height))
+    if page.glyphs is not None:
+        page.glyphs.append((glyph, glyph.position(xy), (font.size, char)))
+    return glyph.advance
 
 
 class _Renderer(object):
@@ -180,133 +865,715 @@ class _Renderer(object):
 
     __slots__ = (
         "_templates",
-        "_rand",
         "_hashed_seed",
+        "_on_stats",
+        "_buffers",
     )
 
-    def __init__(self, templates, seed=None) -> None:
-        self._templates = _to_picklable(templates)
-        self._rand = random.Random()
-        self._hashed_seed = None
-        if seed is not None:
-            self._hashed_seed = hash(seed)
+    def __init__(
+            self, templates, seed=None, on_stats=None, buffers=None
+    ) -> None:
+        """`on_stats` is called with the PageStats of the page, if any, after
+        rendering the page by calling the renderer. The canvases are taken from
+        the BufferPool `buffers` if possible, and the bitmaps of the pages are
+        released to it once rendered."""
+        self._templates = _to_templates(templates)
+        self._hashed_seed = _hash_seed(seed)
+        self._on_stats = on_stats
+        self._buffers = buffers
 
     def __call__(self, page) -> PIL.Image.Image:
-        if self._hashed_seed is None:
+        image = self.render(page, self._hashed_seed)
+        if self._on_stats is not None and page.stats is not None:
+            self._on_stats(page.stats)
+        return image
+
+    def render(self, page, hashed_seed: Optional[int]) -> PIL.Image.Image:
+        """Renders page with the seed hashed by _hash_seed() rather than the
+        seed of the renderer. It is safe to call this method from multiple
+        threads."""
+        if hashed_seed is None:
             # avoid different processes sharing the same random state
-            self._rand.seed()
+            rand = random.Random()
         else:
-            self._rand.seed(a=self._hashed_seed + page.num)
-        return self._perturb_and_merge(page)
+            rand = random.Random(hashed_seed + page.num)
+        canvas = self._perturb_and_merge(page, rand)
+        if self._buffers is not None and page.boxes is not None:
+            _release_page(page, self._buffers)
+        return canvas
+
+    def get_template(self, num: int) -> CompiledTemplate:
+        """Returns the template of the page numbered num."""
+        return _get_template(self._templates, num)
+
+    def get_templates(self) -> Tuple[CompiledTemplate, ...]:
+        return self._templates
+
+    def draft_and_render(
+            self,
+            num: int,
+            text: str,
+            state: tuple,
+            hashed_seed: Optional[int],
+            stats: bool = False,
+    ) -> Tuple[PIL.Image.Image, Optional[PageStats]]:
+        """Drafts the page numbered num from `text`, which is exactly the text
+        of the page, with the random `state` of drafting at the start of the
+        page, and returns the rendered image and the PageStats of the page, if
+        recorded."""
+        rand = random.Random()
+        rand.setstate(state)
+        page, _ = _draft_page(
+            _TextStream((text,)), 0, self._templates, num, rand, stats=stats
+        )
+        return self.render(page, hashed_seed), page.stats
 
-    def _perturb_and_merge(self, page) -> PIL.Image.Image:
-        template = _get_template(self._templates, page.num)
-        canvas = template.get_background().copy()
+    def _perturb_and_merge(self, page, rand) -> PIL.Image.Image:
+        template = self.get_template(page.num)
+        if page.stats is not None:
+            return _perturb_and_merge_with_stats(
+                page, template, rand, self._buffers
+            )
+        canvas = _new_canvas(template.background, self._buffers)
         bbox = page.image.getbbox()
         if bbox is None:
             return canvas
-        strokes = _extract_strokes(page.matrix(), bbox)
-        _draw_strokes(canvas.load(), strokes, template, self._rand)
+        _draw_strokes(canvas, _page_strokes(page, bbox), template, rand)
         return canvas
 
 
-def _to_picklable(templates: Sequence[Template]) -> Sequence[Template]:
-    templates = copy_templates(templates)
-    for t in templates:
-        t.release_font_resource()
-    return templates
+def _perturb_and_merge_with_stats(
+        page, tpl: CompiledTemplate, rand, buffers: Optional[BufferPool]
+) -> PIL.Image.Image:
+    """The same as _Renderer._perturb_and_merge, but times the extraction,
+    perturbation and painting of each stroke to record them in page.stats."""
+    stats = page.stats
+    begin = time.perf_counter()
+    canvas = _new_canvas(tpl.background, buffers)
+    stats.background_time = time.perf_counter() - begin
+    mask = _InkMask(canvas, tpl.fill)
+    paint = mask.paint_by_loop if numpy is None else mask.paint_by_array
+
+    extraction_time = perturbation_time = merge_time = 0.0
+    strokes = ink_pixels = 0
+    begin = time.perf_counter()
+    bbox = page.image.getbbox()
+    for stroke in () if bbox is None else _page_strokes(page, bbox):
+        extracted = time.perf_counter()
+        extraction_time += extracted - begin
+        strokes += 1
+        ink_pixels += len(stroke[0])
+        xs, ys = next(_perturb_strokes((stroke,), tpl, rand))
+        perturbed = time.perf_counter()
+        perturbation_time += perturbed - extracted
+        paint(xs, ys)
+        begin = time.perf_counter()
+        merge_time += begin - perturbed
+    extracted = time.perf_counter()
+    extraction_time += extracted - begin
+
+    mask.flush()
+    stats.merge_time = merge_time + time.perf_counter() - extracted
+    stats.extraction_time = extraction_time
+    stats.perturbation_time = perturbation_time
+    stats.strokes = strokes
+    stats.ink_pixels = ink_pixels
+    return canvas
+
+
+def _page_strokes(page, bbox) -> Iterator[Tuple[Sequence, Sequence]]:
+    if page.glyphs is None:
+        return itertools.chain.from_iterable(
+            _extract_strokes(page.image, band)
+            for band in _ink_bands(page, bbox)
+        )
+    return _extract_glyph_strokes(page)
+
+
+def _hash_seed(seed: Hashable) -> Optional[int]:
+    """Hashes seed in the current process, since the hashes of some objects,
+    e.g. str, vary from process to process."""
+    if seed is None:
+        return None
+    return hash(seed)
 
 
 def _get_template(templates, index):
     return templates[index % len(templates)]
 
 
-def _extract_strokes(bitmap, bbox: Tuple[int, int, int, int]):
+def _ink_bands(page, bbox: Tuple[int, int, int, int]):
+    """Returns the bboxes of the bands of rows holding the ink within bbox,
+    merged from the recorded boxes of page. There is at least one blank row
+    between two bands, so no stroke crosses the bands, and extracting the
+    strokes band by band keeps their row-major order."""
+    if page.boxes is None:
+        return [bbox]
+    left, upper, right, lower = bbox
+    bands = []
+    for box in sorted(page.boxes, key=lambda b: b[1]):
+        box = (max(box[0], left), max(box[1], upper),
+               min(box[2], right), min(box[3], lower))
+        if box[0] >= box[2] or box[1] >= box[3]:
+            continue
+        if bands and box[1] <= bands[-1][3]:
+            band = bands[-1]
+            bands[-1] = (min(band[0], box[0]), band[1],
+                         max(band[2], box[2]), max(band[3], box[3]))
+        else:
+            bands.append(box)
+    return bands
+
+
+def _extract_strokes(image, bbox: Tuple[int, int, int, int]):
+    """Returns an Iterator of the strokes, i.e. the 4-connected components, of
+    the white pixels of `image` in `bbox`.
+
+    Each stroke is a pair of equal-length integer sequences `(xs, ys)`, and the
+    strokes are ordered by their first pixels in row-major order, which is the
+    order that the random states of the renderer are consumed in.
+    """
     left, upper, right, lower = bbox
     assert left >= 0 and upper >= 0
-    # reserve 0xFFFFFFFF as _STROKE_END
-    if right >= _MAX_INT16_VALUE or lower >= _MAX_INT16_VALUE:
-        msg = "the width or height of backgrounds can not exceed {}".format(
-            _MAX_INT16_VALUE - 1
+    if numpy is None:
+        return _extract_strokes_by_dfs(image.load(), bbox)
+    return _extract_strokes_by_runs(image, bbox)
+
+
+def _extract_strokes_by_runs(image, bbox: Tuple[int, int, int, int]):
+    """The NumPy implementation of _extract_strokes(), which labels the
+    horizontal runs of white pixels instead of the pixels themselves."""
+    left, upper, right, lower = bbox
+    tile_height = max(_TILE_PIXELS // (right - left), 1)
+    if lower - upper > tile_height:
+        return _extract_strokes_by_tiles(image, bbox, tile_height)
+    return _extract_strokes_in_tile(image, bbox)
+
+
+def _extract_strokes_in_tile(image, bbox: Tuple[int, int, int, int]):
+    for ys, starts, ends in _stroke_runs_in_tile(image, bbox):
+        yield _expand_runs(ys, starts, ends)
+
+
+def _stroke_runs_in_tile(image, bbox: Tuple[int, int, int, int]):
+    """Yields the (ys, starts, ends) runs of each stroke in bbox, in the order
+    of _extract_strokes_in_tile()."""
+    left, upper, right, lower = bbox
+    ys, starts, ends = _find_runs(_to_bool_array(image.crop(bbox)))
+    labels = _label_runs(ys, starts, ends, right - left)
+    # The label of a stroke is the index of its first run, so sorting by label
+    # keeps the strokes in row-major order.
+    order = numpy.argsort(labels, kind="stable")
+    _, firsts = numpy.unique(labels[order], return_index=True)
+    ys = ys[order] + upper
+    starts = starts[order] + left
+    ends = ends[order] + left
+    bounds = firsts.tolist()
+    bounds.append(len(order))
+    for i in range(len(bounds) - 1):
+        s = slice(bounds[i], bounds[i + 1])
+        yield ys[s], starts[s], ends[s]
+
+
+def _extract_stroke_runs(image, bbox: Tuple[int, int, int, int]):
+    """Returns an Iterator of the strokes of `image` in `bbox` in the order of
+    _extract_strokes(), but each as the compact (ys, starts, ends) runs of
+    32-bit integers, which are expanded by _expand_stroke(). The pixels of the
+    i-th run are (x, ys[i]) for starts[i] <= x < ends[i]."""
+    if numpy is None:
+        return (
+            _to_runs(xs, ys)
+            for xs, ys in _extract_strokes_by_dfs(image.load(), bbox)
         )
-        raise BackgroundTooLargeError(msg)
-    strokes = NumericOrderedSet(
-        _UNSIGNED_INT32_TYPECODE,
-        privileged=_STROKE_END
+    return (
+        tuple(a.astype(numpy.int32) for a in runs)
+        for runs in _stroke_runs_in_tile(image, bbox)
+    )
+
+
+def _to_runs(xs, ys):
+    """Returns the (ys, starts, ends) runs of the pixels of a stroke."""
+    run_ys = array.array(_INT32_TYPECODE)
+    starts = array.array(_INT32_TYPECODE)
+    ends = array.array(_INT32_TYPECODE)
+    for y, x in sorted(zip(ys, xs)):
+        if run_ys and run_ys[-1] == y and ends[-1] == x:
+            ends[-1] = x + 1
+        else:
+            run_ys.append(y)
+            starts.append(x)
+            ends.append(x + 1)
+    return run_ys, starts, ends
+
+
+def _expand_stroke(runs, left: int, upper: int):
+    """Returns the (xs, ys) pixels of the runs of a stroke translated by (left,
+    upper)."""
+    ys, starts, ends = runs
+    if isinstance(ys, array.array):
+        xs_out = array.array(_UNSIGNED_INT32_TYPECODE)
+        ys_out = array.array(_UNSIGNED_INT32_TYPECODE)
+        for y, start, end in zip(ys, starts, ends):
+            xs_out.extend(range(start + left, end + left))
+            ys_out.extend([y + upper] * (end - start))
+        return xs_out, ys_out
+    return _expand_runs(
+        ys.astype(numpy.intp) + upper,
+        starts.astype(numpy.intp) + left,
+        ends.astype(numpy.intp) + left,
     )
+
+
+def _extract_strokes_by_tiles(
+        image, bbox: Tuple[int, int, int, int], tile_height: int
+):
+    """Labels the runs tile by tile, where each tile is a band of tile_height
+    rows of bbox.
+
+    The strokes crossing the edges of tiles are joined through the runs in the
+    last row of the previous tile. A stroke is yielded once it is complete and
+    no growing stroke starts before it, so the order of the strokes is the same
+    as the one of _extract_strokes_in_tile().
+    """
+    left, upper, right, lower = bbox
+    strokes = {}  # id -> [first pixel, list of runs]
+    complete = []  # heap of (first pixel, id)
+    ids = itertools.count()
+    # the runs in the last row of the previous tile, and the ids of their
+    # strokes
+    last = (numpy.zeros(0, dtype=numpy.intp),) * 4
+    for top in range(upper, lower, tile_height):
+        bottom = min(top + tile_height, lower)
+        tile = image.crop((left, top, right, bottom))
+        ys, starts, ends = _find_runs(_to_bool_array(tile))
+        ys += top
+        labels = _label_runs(
+            numpy.concatenate((last[0], ys)),
+            numpy.concatenate((last[1], starts)),
+            numpy.concatenate((last[2], ends)),
+            right - left,
+        )
+        n = len(last[0])
+        # map the local labels onto the ids of strokes, merging the strokes
+        # joined in this tile
+        aliases = {}
+        local_ids = {}
+        for label, id_ in zip(labels[:n].tolist(), last[3].tolist()):
+            id_ = _resolve(aliases, id_)
+            if label not in local_ids:
+                local_ids[label] = id_
+                continue
+            target = _resolve(aliases, local_ids[label])
+            if target != id_:
+                merged = strokes.pop(id_)
+                strokes[target][0] = min(strokes[target][0], merged[0])
+                strokes[target][1].extend(merged[1])
+                aliases[id_] = target
+        labels = labels[n:]
+        order = numpy.argsort(labels, kind="stable")
+        uniques, firsts = numpy.unique(labels[order], return_index=True)
+        run_ids = numpy.empty(len(ys), dtype=numpy.intp)
+        bounds = firsts.tolist()
+        bounds.append(len(order))
+        for i, label in enumerate(uniques.tolist()):
+            if label in local_ids:
+                id_ = _resolve(aliases, local_ids[label])
+            else:
+                id_ = next(ids)
+                first = order[bounds[i]]
+                strokes[id_] = [(int(ys[first]), int(starts[first])), []]
+                local_ids[label] = id_
+            runs = order[bounds[i]:bounds[i + 1]]
+            strokes[id_][1].append((ys[runs], starts[runs], ends[runs]))
+            run_ids[runs] = id_
+        is_last = ys == bottom - 1
+        last = (ys[is_last], starts[is_last], ends[is_last], run_ids[is_last])
+        growing = set(last[3].tolist())
+        for id_ in set(_resolve(aliases, i) for i in local_ids.values()):
+            if id_ not in growing:
+                heapq.heappush(complete, (strokes[id_][0], id_))
+        if bottom == lower:
+            for id_ in growing:
+                heapq.heappush(complete, (strokes[id_][0], id_))
+            growing.clear()
+        first_growing = min((strokes[i][0] for i in growing), default=None)
+        while complete and (first_growing is None
+                            or complete[0][0] < first_growing):
+            _, id_ = heapq.heappop(complete)
+            runs = strokes.pop(id_)[1]
+            yield _expand_runs(
+                numpy.concatenate([r[0] for r in runs]),
+                numpy.concatenate([r[1] for r in runs]) + left,
+                numpy.concatenate([r[2] for r in runs]) + left,
+            )
+
+
+def _resolve(aliases: Dict[int, int], id_: int) -> int:
+    while id_ in aliases:
+        id_ = aliases[id_]
+    return id_
+
+
+def _to_bool_array(image):
+    """Converts an image with mode "1" to a 2-D bool array."""
+    width, height = image.size
+    packed = numpy.frombuffer(image.tobytes(), dtype=numpy.uint8)
+    bits = numpy.unpackbits(packed.reshape(height, -1), axis=1)
+    return bits[:, :width].astype(bool)
+
+
+def _find_runs(bits):
+    """Returns the rows, the starts and the (exclusive) ends of the horizontal
+    runs of True in `bits`, in row-major order."""
+    height, width = bits.shape
+    padded = numpy.zeros((height, width + 2), dtype=numpy.int8)
+    padded[:, 1:-1] = bits
+    diff = numpy.diff(padded, axis=1)
+    ys, starts = numpy.nonzero(diff == 1)
+    _, ends = numpy.nonzero(diff == -1)
+    return ys, starts, ends
+
+
+def _label_runs(ys, starts, ends, width: int):
+    """Labels the 4-connected components of the runs with the index of their
+    first runs."""
+    n = len(ys)
+    # Map the runs onto one axis, so that the runs in the row above overlapping
+    # a run can be found by binary search.
+    stride = width + 1
+    above = (ys - 1) * stride
+    lo = numpy.searchsorted(ys * stride + ends, above + starts, side="right")
+    hi = numpy.searchsorted(ys * stride + starts, above + ends, side="left")
+    counts = numpy.maximum(hi - lo, 0)
+    total = int(counts.sum())
+    b = numpy.repeat(numpy.arange(n), counts)
+    a = (numpy.repeat(lo - numpy.cumsum(counts) + counts, counts)
+         + numpy.arange(total))
+    # Union-find by hooking the larger roots onto the smaller ones and pointer
+    # jumping until every pair of overlapping runs shares the same root.
+    parent = numpy.arange(n)
+    while True:
+        ra = parent[a]
+        rb = parent[b]
+        if numpy.array_equal(ra, rb):
+            return parent
+        numpy.minimum.at(
+            parent, numpy.maximum(ra, rb), numpy.minimum(ra, rb)
+        )
+        while True:
+            grandparent = parent[parent]
+            if numpy.array_equal(grandparent, parent):
+                break
+            parent = grandparent
+
+
+def _expand_runs(ys, starts, ends):
+    lengths = ends - starts
+    offsets = numpy.cumsum(lengths) - lengths
+    xs = (numpy.repeat(starts - offsets, lengths)
+          + numpy.arange(int(lengths.sum())))
+    return xs, numpy.repeat(ys, lengths)
+
+
+def _extract_strokes_by_dfs(bitmap, bbox: Tuple[int, int, int, int]):
+    """The pure Python implementation of _extract_strokes(), which finds one
+    stroke at a time, so that the previous strokes could be processed before
+    the next one is found."""
+    left, upper, right, lower = bbox
+    visited = PixelSet(bbox)
     for y in range(upper, lower):
         for x in range(left, right):
-            if bitmap[x, y] and strokes.add(_xy(x, y)):
-                _extract_stroke(bitmap, (x, y), strokes, bbox)
-                strokes.add_privileged()
-    return strokes
+            if bitmap[x, y] and visited.add(x, y):
+                yield _extract_stroke(bitmap, (x, y), visited, bbox)
 
 
 def _extract_stroke(
-        bitmap, start: Tuple[int, int], strokes, bbox: Tuple[int, int, int, int]
-) -> None:
-    """Helper function of _extract_strokes() which uses depth first search to
-    find the pixels of a glyph."""
+        bitmap, start: Tuple[int, int], visited, bbox: Tuple[int, int, int, int]
+):
+    """Helper function of _extract_strokes_by_dfs() which uses depth first
+    search to find the pixels of a stroke."""
     left, upper, right, lower = bbox
+    xs = array.array(_UNSIGNED_INT32_TYPECODE)
+    ys = array.array(_UNSIGNED_INT32_TYPECODE)
     stack = [start, ]
     while stack:
         x, y = stack.pop()
-        if y - 1 >= upper and bitmap[x, y - 1] and strokes.add(_xy(x, y - 1)):
+        xs.append(x)
+        ys.append(y)
+        if y - 1 >= upper and bitmap[x, y - 1] and visited.add(x, y - 1):
             stack.append((x, y - 1))
-        if y + 1 < lower and bitmap[x, y + 1] and strokes.add(_xy(x, y + 1)):
+        if y + 1 < lower and bitmap[x, y + 1] and visited.add(x, y + 1):
             stack.append((x, y + 1))
-        if x - 1 >= left and bitmap[x - 1, y] and strokes.add(_xy(x - 1, y)):
+        if x - 1 >= left and bitmap[x - 1, y] and visited.add(x - 1, y):
             stack.append((x - 1, y))
-        if x + 1 < right and bitmap[x + 1, y] and strokes.add(_xy(x + 1, y)):
+        if x + 1 < right and bitmap[x + 1, y] and visited.add(x + 1, y):
             stack.append((x + 1, y))
+    return xs, ys
 
 
-def _draw_strokes(bitmap, strokes, tpl, rand) -> None:
-    stroke = []
-    min_x = _MAX_INT16_VALUE
-    min_y = _MAX_INT16_VALUE
-    max_x = 0
-    max_y = 0
-    for xy in strokes:
-        if xy == _STROKE_END:
-            center = ((min_x + max_x) / 2, (min_y + max_y) / 2)
-            _draw_stroke(bitmap, stroke, tpl, center, rand)
-            min_x = _MAX_INT16_VALUE
-            min_y = _MAX_INT16_VALUE
-            max_x = 0
-            max_y = 0
-            stroke.clear()
-            continue
-        x, y = _x_y(xy)
-        min_x = min(x, min_x)
-        max_x = max(x, max_x)
-        min_y = min(y, min_y)
-        max_y = max(y, max_y)
-        stroke.append((x, y))
-
-
-def _draw_stroke(
-        bitmap,
-        stroke: Sequence[Tuple[int, int]],
-        tpl: Template,
-        center: Tuple[float, float],
-        rand
-) -> None:
-    dx = gauss(rand, 0, tpl.get_perturb_x_sigma())
-    dy = gauss(rand, 0, tpl.get_perturb_y_sigma())
-    theta = gauss(rand, 0, tpl.get_perturb_theta_sigma())
-    for x, y in stroke:
-        new_x, new_y = _rotate(center, x, y, theta)
-        new_x = round(new_x + dx)
-        new_y = round(new_y + dy)
-        width, height = tpl.get_size()
-        if 0 <= new_x < width and 0 <= new_y < height:
-            bitmap[new_x, new_y] = tpl.get_fill()
-
-
-def _rotate(
-        center: Tuple[float, float], x: float, y: float, theta: float
+def _extract_glyph_strokes(page):
+    """Returns an Iterator of the strokes of `page` composed of the recorded
+    strokes of its glyphs, in the order of the glyphs.
+
+    The glyphs whose ink touches each other would make up some strokes across
+    glyphs, so they are relabelled together, like the glyphs crossing the
+    borders of `page`.
+    """
+    glyphs = page.glyphs
+    boxes = [(x, y, x + glyph.mask.width, y + glyph.mask.height)
+             for glyph, (x, y), _ in glyphs]
+    parents = list(range(len(glyphs)))
+    for i, j in _touching_boxes(boxes):
+        if _inks_touch(glyphs[i][0], boxes[i], glyphs[j][0], boxes[j]):
+            _union(parents, i, j)
+    groups = {}
+    for i in range(len(glyphs)):
+        groups.setdefault(_find(parents, i), []).append(i)
+    width, height = page.size()
+    for group in groups.values():
+        left, upper, right, lower = boxes[group[0]]
+        if (len(group) == 1 and left >= 0 and upper >= 0
+                and right <= width and lower <= height):
+            for runs in _glyph_strokes(glyphs[group[0]][0]):
+                yield _expand_stroke(runs, left, upper)
+        else:
+            yield from _extract_group_strokes(
+                [glyphs[i] for i in group], [boxes[i] for i in group], page
+            )
+
+
+def _glyph_strokes(glyph) -> tuple:
+    """Returns the runs of the strokes of glyph, which are extracted once and
+    then kept by the glyph."""
+    if glyph.strokes is None:
+        bbox = (0, 0) + glyph.mask.size
+        glyph.strokes = tuple(_extract_stroke_runs(glyph.mask, bbox))
+    return glyph.strokes
+
+
+def _touching_boxes(boxes):
+    """Yields the index pairs of the boxes which overlap or are adjacent to each
+    other."""
+    active = []
+    for i in sorted(range(len(boxes)), key=lambda k: boxes[k][1]):
+        left, upper, right, lower = boxes[i]
+        active = [j for j in active if boxes[j][3] >= upper]
+        for j in active:
+            if boxes[j][0] <= right and left <= boxes[j][2]:
+                yield min(i, j), max(i, j)
+        active.append(i)
+
+
+def _inks_touch(glyph1, box1, glyph2, box2) -> bool:
+    """Returns whether the ink of the two placed glyphs overlap or are
+    4-adjacent."""
+    left = max(box1[0] - 1, box2[0])
+    upper = max(box1[1] - 1, box2[1])
+    right = min(box1[2] + 1, box2[2])
+    lower = min(box1[3] + 1, box2[3])
+    if left >= right or upper >= lower:
+        return False
+    size = (right - left, lower - upper)
+    # the ink of glyph1 dilated by the 4-neighbourhood
+    near = PIL.Image.new(_INTERNAL_MODE, size, _BLACK)
+    for dx, dy in ((0, 0), (-1, 0), (1, 0), (0, -1), (0, 1)):
+        xy = (box1[0] + dx - left, box1[1] + dy - upper)
+        near.paste(_WHITE, xy, mask=glyph1.mask)
+    ink = PIL.Image.new(_INTERNAL_MODE, size, _BLACK)
+    ink.paste(_WHITE, (box2[0] - left, box2[1] - upper), mask=glyph2.mask)
+    return PIL.ImageChops.logical_and(near, ink).getbbox() is not None
+
+
+def _find(parents: List[int], i: int) -> int:
+    while parents[i] != i:
+        parents[i] = parents[parents[i]]
+        i = parents[i]
+    return i
+
+
+def _union(parents: List[int], i: int, j: int) -> None:
+    i = _find(parents, i)
+    j = _find(parents, j)
+    parents[max(i, j)] = min(i, j)
+
+
+def _extract_group_strokes(glyphs, boxes, page):
+    """Extracts the strokes of a group of placed glyphs within `page`."""
+    width, height = page.size()
+    left = max(min(b[0] for b in boxes), 0)
+    upper = max(min(b[1] for b in boxes), 0)
+    right = min(max(b[2] for b in boxes), width)
+    lower = min(max(b[3] for b in boxes), height)
+    if left >= right or upper >= lower:
+        return
+    image = PIL.Image.new(_INTERNAL_MODE, (right - left, lower - upper), _BLACK)
+    for glyph, (x, y), _ in glyphs:
+        image.paste(_WHITE, (x - left, y - upper), mask=glyph.mask)
+    bbox = image.getbbox()
+    if bbox is None:
+        return
+    for xs, ys in _extract_strokes(image, bbox):
+        yield _translate(xs, left), _translate(ys, upper)
+
+
+def _translate(coordinates, offset: int):
+    """Adds offset to the coordinates of a stroke."""
+    if isinstance(coordinates, array.array):
+        translated = [c + offset for c in coordinates]
+        return array.array(coordinates.typecode, translated)
+    return coordinates + offset
+
+
+def _draw_strokes(canvas, strokes, tpl: CompiledTemplate, rand) -> None:
+    """Perturbs the strokes, and then fills the perturbed pixels of `canvas`."""
+    _merge_strokes(canvas, _perturb_strokes(strokes, tpl, rand), tpl)
+
+
+def _perturb_strokes(strokes, tpl: CompiledTemplate, rand):
+    if numpy is None:
+        return _perturb_strokes_by_loop(strokes, tpl, rand)
+    return _perturb_strokes_by_array(strokes, tpl, rand)
+
+
+def _merge_strokes(canvas, perturbed, tpl: CompiledTemplate) -> None:
+    """Fills the perturbed pixels of `canvas`. Each stroke is painted into an
+    _InkMask as soon as it is perturbed, so the perturbed strokes of the page
+    are never held at once."""
+    mask = _InkMask(canvas, tpl.fill)
+    paint = mask.paint_by_loop if numpy is None else mask.paint_by_array
+    for xs, ys in perturbed:
+        paint(xs, ys)
+    mask.flush()
+
+
+class _InkMask(object):
+    """The mask of the pixels to fill of a canvas, in bands of rows of about
+    _TILE_PIXELS pixels with one byte per pixel. The bands are allocated on
+    demand, and the earliest one is pasted onto the canvas once more than
+    _MAX_MASK_BANDS bands are needed. Filling some pixels again later changes
+    nothing, so the strokes could come in any order."""
+
+    __slots__ = ("_canvas", "_fill", "_width", "_band_height", "_bands")
+
+    def __init__(self, canvas: PIL.Image.Image, fill) -> None:
+        self._canvas = canvas
+        self._fill = fill
+        self._width = canvas.width
+        self._band_height = max(_TILE_PIXELS // canvas.width, 1)
+        self._bands = {}  # band index -> bytearray, in the order of allocation
+
+    def paint_by_array(self, xs, ys) -> None:
+        if len(ys) == 0:
+            return
+        height = self._band_height
+        first = int(ys.min()) // height
+        last = int(ys.max()) // height
+        if first == last:
+            self._paint_array_in_band(first, xs, ys)
+            return
+        indices = ys // height
+        for index in range(first, last + 1):
+            inside = indices == index
+            if inside.any():
+                self._paint_array_in_band(index, xs[inside], ys[inside])
+
+    def _paint_array_in_band(self, index: int, xs, ys) -> None:
+        band = numpy.frombuffer(self._band(index), dtype=numpy.uint8)
+        band = band.reshape(-1, self._width)
+        band[ys - index * self._band_height, xs] = 0xFF
+
+    def paint_by_loop(self, xs, ys) -> None:
+        width = self._width
+        height = self._band_height
+        band = None
+        upper = lower = 0
+        for x, y in zip(xs, ys):
+            if not upper <= y < lower:
+                index = y // height
+                band = self._band(index)
+                upper = index * height
+                lower = upper + height
+            band[(y - upper) * width + x] = 0xFF
+
+    def _band(self, index: int) -> bytearray:
+        band = self._bands.get(index)
+        if band is None:
+            if len(self._bands) >= _MAX_MASK_BANDS:
+                self._flush_band(next(iter(self._bands)))
+            upper = index * self._band_height
+            rows = min(self._band_height, self._canvas.height - upper)
+            band = bytearray(rows * self._width)
+            self._bands[index] = band
+        return band
+
+    def flush(self) -> None:
+        """Pastes the remaining bands onto the canvas."""
+        for index in list(self._bands):
+            self._flush_band(index)
+
+    def _flush_band(self, index: int) -> None:
+        band = self._bands.pop(index)
+        size = (self._width, len(band) // self._width)
+        mask = PIL.Image.frombuffer("L", size, band, "raw", "L", 0, 1)
+        bbox = mask.getbbox()
+        if bbox is None:
+            return
+        left, upper, _, _ = bbox
+        xy = (left, index * self._band_height + upper)
+        # pasting through a bilevel mask is much faster
+        mask = mask.crop(bbox).convert("1", dither=_NO_DITHER)
+        self._canvas.paste(self._fill, xy, mask=mask)
+
+
+def _perturb_strokes_by_array(strokes, tpl: CompiledTemplate, rand):
+    """Yields the perturbed strokes clipped to the canvas."""
+    width, height = tpl.size
+    for xs, ys in strokes:
+        center = _center(int(xs.min()), int(ys.min()),
+                         int(xs.max()), int(ys.max()))
+        dx, dy, theta = _perturbation(tpl, rand)
+        new_xs, new_ys = _rotate(center, xs, ys, theta)
+        new_xs = numpy.rint(new_xs + dx).astype(numpy.intp)
+        new_ys = numpy.rint(new_ys + dy).astype(numpy.intp)
+        inside = ((0 <= new_xs) & (new_xs < width)
+                  & (0 <= new_ys) & (new_ys < height))
+        yield new_xs[inside], new_ys[inside]
+
+
+def _perturb_strokes_by_loop(strokes, tpl: CompiledTemplate, rand):
+    width, height = tpl.size
+    for xs, ys in strokes:
+        center = _center(min(xs), min(ys), max(xs), max(ys))
+        dx, dy, theta = _perturbation(tpl, rand)
+        new_xs = []
+        new_ys = []
+        for x, y in zip(xs, ys):
+            new_x, new_y = _rotate(center, x, y, theta)
+            new_x = round(new_x + dx)
+            new_y = round(new_y + dy)
+            if 0 <= new_x < width and 0 <= new_y < height:
+                new_xs.append(new_x)
+                new_ys.append(new_y)
+        yield new_xs, new_ys
+
+
+def _center(
+        min_x: int, min_y: int, max_x: int, max_y: int
 ) -> Tuple[float, float]:
+    return (min_x + max_x) / 2, (min_y + max_y) / 2
+
+
+def _perturbation(tpl: CompiledTemplate, rand) -> Tuple[float, float, float]:
+    """Returns the random offsets of x, y and theta of a stroke."""
+    dx = gauss(rand, 0, tpl.perturb_x_sigma)
+    dy = gauss(rand, 0, tpl.perturb_y_sigma)
+    theta = gauss(rand, 0, tpl.perturb_theta_sigma)
+    return dx, dy, theta
+
+
+def _rotate(center: Tuple[float, float], x, y, theta: float):
+    """Rotates the point(s) around `center`. `x` and `y` could be either numbers
+    or NumPy arrays."""
     if theta == 0:
         return x, y
     new_x = ((x - center[0]) * math.cos(theta)
@@ -316,11 +1583,3 @@ def _rotate(
              - (x - center[0]) * math.sin(theta)
              + center[1])
     return new_x, new_y
-
-
-def _xy(x: int, y: int) -> int:
-    return (x << 16) | y
-
-
-def _x_y(xy: int) -> Tuple[int, int]:
-    return xy >> 16, xy & 0xFFFF
@@ -7,5 +7,7 @@ class LayoutError(Error):
     pass
 
 
+# No longer raised, since the size of backgrounds is not limited any more. Kept
+# for backward compatibility.
 class BackgroundTooLargeError(Error):
     pass
@@ -0,0 +1,122 @@
+# coding: utf-8
+from handright._util import *
+
+# The same as _INTERNAL_MODE and _WHITE in handright._core
+_GLYPH_MODE = "1"
+_INK = 1
+_BLANK = 0
+
+
+class Glyph(object):
+    """A rasterized char in mode "1", which could be pasted onto pages in
+    place of drawing the char again."""
+
+    __slots__ = ("mask", "offset", "advance", "strokes")
+
+    def __init__(
+            self,
+            mask: Optional[PIL.Image.Image],
+            offset: Tuple[int, int],
+            advance: int,
+    ) -> None:
+        """`mask` is None if the char has no ink. `offset` is the position of
+        `mask` relative to the position where the char is drawn. `advance` is
+        the width of the bbox of the char."""
+        self.mask = mask
+        self.offset = offset
+        self.advance = advance
+        # the (ys, starts, ends) runs of the strokes of mask, which are
+        # extracted on demand
+        self.strokes = None
+
+    def paste(self, image: PIL.Image.Image, xy: Tuple[int, int]) -> None:
+        """Pastes the ink of the glyph onto `image` as if drawing the char at
+        `xy`."""
+        if self.mask is not None:
+            image.paste(_INK, self.position(xy), mask=self.mask)
+
+    def position(self, xy: Tuple[int, int]) -> Tuple[int, int]:
+        """Returns the position of mask if drawing the char at `xy`."""
+        return xy[0] + self.offset[0], xy[1] + self.offset[1]
+
+
+class GlyphCache(object):
+    """A bounded LRU cache of the rasterized chars, keyed by font and char.
+
+    A `GlyphCache` could be passed to `handright.handwrite()` to share the
+    glyphs across calls, and its `cache_info()` could be used to tune its
+    `maxsize`.
+    """
+
+    __slots__ = ("_cache",)
+
+    DEFAULT_MAXSIZE = 4096
+
+    def __init__(self, maxsize: int = DEFAULT_MAXSIZE) -> None:
+        """`maxsize` is the maximum number of glyphs to keep. A `maxsize` of `0`
+        disables caching."""
+        self._cache = LRUCache(maxsize)
+
+    def get(self, font, char: str) -> Glyph:
+        return self._cache.get(
+            (_font_key(font), char), lambda: _rasterize(font, char)
+        )
+
+    def cache_info(self) -> CacheInfo:
+        """Returns a named tuple showing hits, misses, maxsize and currsize."""
+        return self._cache.cache_info()
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+
+class AdvanceCache(object):
+    """A bounded LRU cache of the advances of the chars, which provides the same
+    `get` as GlyphCache but returns the glyphs without ink. It is used to layout
+    the text without rasterizing the chars."""
+
+    __slots__ = ("_cache",)
+
+    def __init__(self, maxsize: int = GlyphCache.DEFAULT_MAXSIZE) -> None:
+        self._cache = LRUCache(maxsize)
+
+    def get(self, font, char: str) -> Glyph:
+        return self._cache.get(
+            (_font_key(font), char), lambda: _measure(font, char)
+        )
+
+
+def _font_key(font) -> Hashable:
+    """Returns a key identifying the glyphs of font. The fonts loaded from the
+    same file with the same settings share the same key."""
+    path = getattr(font, "path", None)
+    if isinstance(path, (str, bytes)):
+        return (
+            path,
+            getattr(font, "index", None),
+            font.size,
+            getattr(font, "encoding", None),
+            getattr(font, "layout_engine", None),
+        )
+    # the key keeps the font alive, so its id will not be reused
+    return font
+
+
+def _rasterize(font, char: str) -> Glyph:
+    left, top, right, bottom = font.getbbox(char)
+    # the ink may slightly overflow the bbox
+    padding = max(font.size, 1)
+    size = (right - left + 2 * padding, bottom - top + 2 * padding)
+    origin = (padding - left, padding - top)
+    image = PIL.Image.new(_GLYPH_MODE, size, _BLANK)
+    PIL.ImageDraw.Draw(image).text(origin, char, fill=_INK, font=font)
+    bbox = image.getbbox()
+    if bbox is None:
+        return Glyph(None, (0, 0), right - left)
+    offset = (bbox[0] - origin[0], bbox[1] - origin[1])
+    return Glyph(image.crop(bbox), offset, right - left)
+
+
+def _measure(font, char: str) -> Glyph:
+    left, _, right, _ = font.getbbox(char)
+    return Glyph(None, (0, 0), right - left)
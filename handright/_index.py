@@ -0,0 +1,270 @@
+# coding: utf-8
+import hashlib
+import json
+import os
+
+from handright._core import _draft_page, _hash_seed, _preprocess_text
+from handright._core import _Renderer, _TextStream, _to_templates
+from handright._glyph import *
+from handright._template import *
+from handright._util import *
+
+_FORMAT_VERSION = 2
+# random.Random.random() consumes 64 bits of the Mersenne Twister
+_BITS_PER_DRAW = 64
+# the draws skipped by each call of getrandbits when replaying
+_DRAWS_PER_SKIP = 1 << 16
+
+
+class PageIndex(object):
+    """The checkpoints of drafting a text page by page, i.e. the start index of
+    each page and the random state of drafting at the start, with which any
+    page could be handwritten without drafting the pages before it.
+
+    Rather than the whole random state, each checkpoint only keeps the number
+    of the random draws since seeding and the cached value of `gauss`, from
+    which the state is restored by skipping the draws. So a PageIndex takes a
+    few dozens of bytes per page.
+
+    A PageIndex only fits the text, the templates and the seed it was built
+    with, which are recorded in it. It could be saved to and loaded from files,
+    so that the pages of long texts could be served one by one on demand.
+    """
+
+    __slots__ = (
+        "_starts", "_checkpoints", "_digest", "_seed", "_draft_seed",
+        "_template_digests",
+    )
+
+    def __init__(
+            self,
+            starts: Sequence[int],
+            checkpoints: Sequence[Tuple[int, Optional[float]]],
+            digest: str,
+            seed: Hashable,
+            draft_seed: Hashable,
+            template_digests: Sequence[str],
+    ) -> None:
+        """`checkpoints` are the (number of draws, cached gauss value) pairs of
+        the pages. `digest` is the one of the preprocessed text. `draft_seed` is
+        the seed of drafting, which is `seed` unless `seed` is None."""
+        self._starts = starts
+        self._checkpoints = checkpoints
+        self._digest = digest
+        self._seed = seed
+        self._draft_seed = draft_seed
+        self._template_digests = template_digests
+
+    @classmethod
+    def build(
+            cls,
+            text: str,
+            template: Union[Template, Sequence[Template]],
+            seed: Hashable = None,
+    ) -> "PageIndex":
+        """Builds the index by laying out the text without rendering it. The
+        arguments are the same as the ones of `handright.handwrite`.
+
+        Throw LayoutError, if the settings are conflicting, which makes it
+        impossible to layout the `text`.
+        """
+        templates = _to_templates(template)
+        text = _preprocess_text(text)
+        stream = _TextStream((text,))
+        draft_seed = seed
+        if seed is None:
+            # the drafting is as random as the one seeded with None, but could
+            # be restored from the index
+            draft_seed = random.SystemRandom().getrandbits(64)
+        rand = _CountingRandom(draft_seed)
+        starts = []
+        checkpoints = []
+        start = 0
+        num = 0
+        while not stream.ends_at(start):
+            starts.append(start)
+            checkpoints.append((rand.draws, rand.gauss_next))
+            _, start = _draft_page(
+                stream, start, templates, num, rand, layout=True
+            )
+            num += 1
+        return cls(
+            starts, checkpoints, _digest(text), seed, draft_seed,
+            [t.digest() for t in templates],
+        )
+
+    def __len__(self) -> int:
+        """Returns the number of the pages."""
+        return len(self._starts)
+
+    def get_start(self, num: int) -> int:
+        """Returns the start index of the page numbered `num` in the text with
+        all the line separators replaced by "\\n"."""
+        return self._starts[num]
+
+    def get_state(self, num: int) -> tuple:
+        """Returns the random state of drafting at the start of the page
+        numbered `num`."""
+        draws, gauss_next = self._checkpoints[num]
+        rand = random.Random(self._draft_seed)
+        while draws > 0:
+            skipped = min(draws, _DRAWS_PER_SKIP)
+            rand.getrandbits(skipped * _BITS_PER_DRAW)
+            draws -= skipped
+        rand.gauss_next = gauss_next
+        return rand.getstate()
+
+    def matches(self, text: str) -> bool:
+        """Returns True if the index was built with `text`."""
+        return _digest(_preprocess_text(text)) == self._digest
+
+    def save(self, fp) -> None:
+        """Saves the index as JSON to `fp`, which could be a filename or a text
+        file object. The seed must be None, a bool, an int, a float or a str.
+        """
+        pages = [
+            [start, draws, gauss_next]
+            for start, (draws, gauss_next) in zip(
+                self._starts, self._checkpoints
+            )
+        ]
+        data = {
+            "version": _FORMAT_VERSION,
+            "digest": self._digest,
+            "seed": self._seed,
+            "draft_seed": self._draft_seed,
+            "templates": self._template_digests,
+            "pages": pages,
+        }
+        if isinstance(fp, (str, bytes, os.PathLike)):
+            with open(fp, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+        else:
+            json.dump(data, fp)
+
+    @classmethod
+    def load(cls, fp) -> "PageIndex":
+        """Loads the index saved by `PageIndex.save` from `fp`, which could be a
+        filename or a text file object."""
+        if isinstance(fp, (str, bytes, os.PathLike)):
+            with open(fp, encoding="utf-8") as f:
+                data = json.load(f)
+        else:
+            data = json.load(fp)
+        if data.get("version") != _FORMAT_VERSION:
+            raise ValueError(
+                "unsupported PageIndex version: {}".format(data.get("version"))
+            )
+        starts = [start for start, _, _ in data["pages"]]
+        checkpoints = [
+            (draws, gauss_next) for _, draws, gauss_next in data["pages"]
+        ]
+        return cls(
+            starts, checkpoints, data["digest"], data["seed"],
+            data["draft_seed"], data["templates"],
+        )
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, PageIndex):
+            return NotImplemented
+        return self._values() == other._values()
+
+    __hash__ = None
+
+    def _values(self) -> tuple:
+        return (list(self._starts), list(self._checkpoints), self._digest,
+                self._seed, self._draft_seed, list(self._template_digests))
+
+    def _check(
+            self,
+            text: str,
+            templates: Sequence[CompiledTemplate],
+            seed: Hashable,
+    ) -> None:
+        if not self.matches(text):
+            raise ValueError("the text does not match the index")
+        if seed != self._seed:
+            raise ValueError("the seed does not match the index")
+        if [t.digest() for t in templates] != list(self._template_digests):
+            raise ValueError("the templates do not match the index")
+
+
+def render_page(
+        text: str,
+        template: Union[Template, Sequence[Template]],
+        index: PageIndex,
+        num: int,
+        seed: Hashable = None,
+        glyph_cache: Optional[GlyphCache] = None,
+) -> PIL.Image.Image:
+    """Handwrite the page numbered `num` of `text` with the help of `index`,
+    and return the Pillow's Image, which is the same as the one output by
+    `handright.handwrite` with the same arguments.
+
+    `template` and `seed` must be the ones `index` was built with, and
+    `glyph_cache` is the same as the one of `handright.handwrite`.
+
+    Throw ValueError, if `index` was not built with `text`, `template` and
+    `seed`, and IndexError, if there is no such page.
+    """
+    return next(render_pages(
+        text, template, index, num, num + 1, seed, glyph_cache
+    ))
+
+
+def render_pages(
+        text: str,
+        template: Union[Template, Sequence[Template]],
+        index: PageIndex,
+        start: int,
+        stop: Optional[int] = None,
+        seed: Hashable = None,
+        glyph_cache: Optional[GlyphCache] = None,
+) -> Iterator[PIL.Image.Image]:
+    """Handwrite the pages numbered from `start` to `stop` (exclusive, defaults
+    to the last page) of `text` with the help of `index`, and return an
+    Iterator of Pillow's Images. The pages before `start` are not drafted. The
+    other arguments are the same as the ones of `render_page`.
+
+    Throw ValueError, if `index` was not built with `text`, `template` and
+    `seed`, and IndexError, if there is no page numbered `start`.
+    """
+    templates = _to_templates(template)
+    index._check(text, templates, seed)
+    if not 0 <= start < len(index):
+        raise IndexError("page number out of range")
+    if stop is None or stop > len(index):
+        stop = len(index)
+    return _render_pages(
+        text, templates, index, start, stop, seed, glyph_cache
+    )
+
+
+def _render_pages(text, templates, index, start, stop, seed, glyph_cache):
+    renderer = _Renderer(templates)
+    hashed_seed = _hash_seed(seed)
+    stream = _TextStream((text,))
+    rand = random.Random()
+    rand.setstate(index.get_state(start))
+    text_start = index.get_start(start)
+    for num in range(start, stop):
+        page, text_start = _draft_page(
+            stream, text_start, templates, num, rand, glyph_cache
+        )
+        yield renderer.render(page, hashed_seed)
+
+
+def _digest(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class _CountingRandom(random.Random):
+    """A Random counting the calls of random(), through which gauss() draws."""
+
+    def __init__(self, x=None) -> None:
+        self.draws = 0
+        super().__init__(x)
+
+    def random(self) -> float:
+        self.draws += 1
+        return super().random()
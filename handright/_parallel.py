@@ -0,0 +1,341 @@
+# coding: utf-8
+import functools
+import itertools
+import multiprocessing
+import os
+from multiprocessing import resource_tracker
+from multiprocessing import shared_memory
+
+from handright._glyph import GlyphCache
+from handright._util import *
+
+# The renderers of the current worker process, which are set by the initializer
+# of the pool, so that the templates are sent to each worker only once.
+_renderers = None
+# The glyphs of the current worker process, which the shared pages refer to by
+# their font sizes and chars instead of carrying them.
+_glyphs = None
+
+
+class RenderPool(object):
+    """A process pool whose workers share the same renderers. The tasks only
+    carry the indices of the renderers, the hashed seeds and the drafted pages.
+
+    With `shared_memory` on, the drafted bitmaps and the rendered canvases are
+    transferred through the shared memory blocks allocated by the parent
+    process, and only small descriptors cross the process boundaries. The
+    glyphs recorded by the pages are sent as their font sizes, chars and
+    positions, and rasterized again in a glyph cache of each worker.
+
+    The tasks are consumed lazily in the thread iterating the results, and at
+    most `max_in_flight` tasks are submitted but not yet yielded at any time,
+    so the memory is bounded however slow the consumer is.
+    """
+
+    __slots__ = (
+        "_pool", "_renderers", "_shared_memory", "_canvas_nbytes",
+        "_max_in_flight",
+    )
+
+    def __init__(
+            self,
+            renderers: Sequence,
+            workers: Optional[int],
+            shared_memory: bool = False,
+            max_in_flight: Optional[int] = None,
+    ) -> None:
+        """Each of `renderers` must provide `render(page, hashed_seed)` and
+        `get_template(num)`. `workers` is the number of processes, which
+        defaults to the number of CPUs. `max_in_flight` defaults to twice the
+        number of processes."""
+        if shared_memory and os.name == "posix":
+            # let the workers share the resource tracker of this process, so
+            # that the blocks attached by workers are not regarded as leaked
+            resource_tracker.ensure_running()
+        if workers is None:
+            workers = os.cpu_count() or 1
+        if max_in_flight is None:
+            max_in_flight = 2 * workers
+        if max_in_flight < 1:
+            raise ValueError("max_in_flight must be positive")
+        self._pool = multiprocessing.Pool(workers, _init_worker, (renderers,))
+        self._renderers = renderers
+        self._shared_memory = shared_memory
+        self._canvas_nbytes = {}
+        self._max_in_flight = max_in_flight
+
+    def imap(
+            self,
+            pages: Iterable[Page],
+            hashed_seed: Optional[int],
+            index: int = 0,
+            ordered: bool = True,
+    ) -> Iterator:
+        """Renders the pages with the renderer at `index`, and returns an
+        Iterator of the rendered images. `ordered` is the same as the one of
+        `RenderPool.imap_tasks`."""
+        return self.imap_tasks(
+            zip(itertools.repeat(index), itertools.repeat(hashed_seed), pages),
+            ordered=ordered,
+        )
+
+    def imap_tasks(
+            self,
+            tasks: Iterable[Tuple[int, Optional[int], Page]],
+            on_stats: Optional[Callable[[PageStats], Any]] = None,
+            ordered: bool = True,
+    ) -> Iterator:
+        """Renders each page of the (renderer index, hashed seed, page) tasks,
+        and returns an Iterator of the rendered images in order. If `ordered`
+        is False, the Iterator yields the (task index, image) pairs as soon as
+        the pages are rendered instead.
+
+        `on_stats` is called in the current process with the PageStats of each
+        rendered page, if recorded."""
+        if self._shared_memory:
+            results = self._imap_shared(tasks, ordered)
+        else:
+            results = self._imap_bounded(_render, tasks, ordered)
+        return _collect(results, on_stats, ordered)
+
+    def imap_drafts(
+            self,
+            tasks: Iterable[Tuple[int, Optional[int], int, str, tuple, bool]],
+            on_stats: Optional[Callable[[PageStats], Any]] = None,
+            ordered: bool = True,
+    ) -> Iterator:
+        """The same as `RenderPool.imap_tasks`, but drafts each page of the
+        (renderer index, hashed seed, page number, text of the page, random
+        state, stats) tasks in the workers as well. Each of the renderers must
+        provide `draft_and_render(num, text, state, hashed_seed, stats)`."""
+        results = self._imap_bounded(_draft_and_render, tasks, ordered)
+        return _collect(results, on_stats, ordered)
+
+    def _imap_bounded(
+            self, func: Callable, tasks: Iterable, ordered: bool
+    ) -> Iterator[Tuple[int, Any]]:
+        """Applies func to each of tasks in the pool, and yields the (task
+        index, result) pairs in the order of the tasks if `ordered`, otherwise
+        in the order of completion."""
+        running = {}  # task index -> AsyncResult
+        done = queue.Queue()  # the indices of the completed tasks if unordered
+        tasks = enumerate(tasks)
+        exhausted = False
+        next_index = 0
+        while True:
+            while not exhausted and len(running) < self._max_in_flight:
+                task = next(tasks, None)
+                if task is None:
+                    exhausted = True
+                    break
+                index, task = task
+                if ordered:
+                    running[index] = self._pool.apply_async(func, (task,))
+                else:
+                    notify = functools.partial(_notify, done, index)
+                    running[index] = self._pool.apply_async(
+                        func, (task,), callback=notify, error_callback=notify
+                    )
+            if not running:
+                return
+            if ordered:
+                index = next_index
+                next_index += 1
+            else:
+                index = done.get()
+            yield index, running.pop(index).get()
+
+    def _imap_shared(
+            self, tasks, ordered: bool
+    ) -> Iterator[Tuple[int, Tuple[PIL.Image.Image, Optional[PageStats]]]]:
+        blocks = {}  # task id -> (page block, canvas block, index, num)
+
+        def share_pages():
+            for task_id, (index, hashed_seed, page) in enumerate(tasks):
+                data = page.image.tobytes()
+                page_block = _create_block(len(data))
+                canvas_block = _create_block(
+                    self._get_canvas_nbytes(index, page.num)
+                )
+                blocks[task_id] = (page_block, canvas_block, index, page.num)
+                page_block.buf[:len(data)] = data
+                glyphs = page.glyphs
+                if glyphs is not None:
+                    glyphs = [(xy, key) for _, xy, key in glyphs]
+                yield (task_id, index, hashed_seed, page.num, page.image.mode,
+                       page.size(), glyphs, page.boxes, page.stats,
+                       page_block.name, canvas_block.name)
+
+        try:
+            results = self._imap_bounded(
+                _render_shared, share_pages(), ordered
+            )
+            for task_id, (_, stats) in results:
+                page_block, canvas_block, index, num = blocks.pop(task_id)
+                background = self._renderers[index].get_template(num).background
+                data = _read_block(
+                    canvas_block, self._get_canvas_nbytes(index, num)
+                )
+                canvas = _like_background(
+                    PIL.Image.frombytes(background.mode, background.size, data),
+                    background,
+                )
+                _destroy_block(page_block)
+                _destroy_block(canvas_block)
+                yield task_id, (canvas, stats)
+        finally:
+            for page_block, canvas_block, _, _ in blocks.values():
+                _destroy_block(page_block)
+                _destroy_block(canvas_block)
+
+    def _get_canvas_nbytes(self, index: int, num: int) -> int:
+        template = self._renderers[index].get_template(num)
+        background = template.background
+        key = (background.mode, background.size)
+        if key not in self._canvas_nbytes:
+            self._canvas_nbytes[key] = _count_nbytes(*key)
+        return self._canvas_nbytes[key]
+
+    def close(self) -> None:
+        self._pool.terminate()
+        self._pool.join()
+
+
+def imap_in_pool(
+        renderers: Sequence,
+        tasks: Iterable[Tuple[int, Optional[int], Page]],
+        workers: Optional[int],
+        shared_memory: bool = False,
+        on_stats: Optional[Callable[[PageStats], Any]] = None,
+        max_in_flight: Optional[int] = None,
+        ordered: bool = True,
+) -> Iterator:
+    """Renders the tasks in a new RenderPool of `renderers`, and yields the
+    same as `RenderPool.imap_tasks`. The pool is closed once the iteration
+    ends."""
+    pool = RenderPool(renderers, workers, shared_memory, max_in_flight)
+    try:
+        yield from pool.imap_tasks(tasks, on_stats, ordered)
+    finally:
+        pool.close()
+
+
+def imap_drafts_in_pool(
+        renderers: Sequence,
+        tasks: Iterable[Tuple[int, Optional[int], int, str, tuple, bool]],
+        workers: Optional[int],
+        on_stats: Optional[Callable[[PageStats], Any]] = None,
+        max_in_flight: Optional[int] = None,
+        ordered: bool = True,
+) -> Iterator:
+    """The same as `RenderPool.imap_drafts`, but in a new RenderPool which is
+    closed once the iteration ends."""
+    pool = RenderPool(renderers, workers, max_in_flight=max_in_flight)
+    try:
+        yield from pool.imap_drafts(tasks, on_stats, ordered)
+    finally:
+        pool.close()
+
+
+def _collect(results, on_stats, ordered: bool) -> Iterator:
+    for index, (image, stats) in results:
+        if on_stats is not None and stats is not None:
+            on_stats(stats)
+        yield image if ordered else (index, image)
+
+
+def _notify(done: queue.Queue, index: int, _) -> None:
+    done.put(index)
+
+
+def _init_worker(renderers) -> None:
+    global _renderers, _glyphs
+    _renderers = renderers
+    _glyphs = GlyphCache()
+
+
+def _render(
+        task: Tuple[int, Optional[int], Page]
+) -> Tuple[PIL.Image.Image, Optional[PageStats]]:
+    index, hashed_seed, page = task
+    return _renderers[index].render(page, hashed_seed), page.stats
+
+
+def _draft_and_render(
+        task: Tuple[int, Optional[int], int, str, tuple, bool]
+) -> Tuple[PIL.Image.Image, Optional[PageStats]]:
+    index, hashed_seed, num, text, state, stats = task
+    return _renderers[index].draft_and_render(
+        num, text, state, hashed_seed, stats
+    )
+
+
+def _render_shared(task) -> Tuple[int, Optional[PageStats]]:
+    """Renders the page in the shared memory into the shared canvas, and returns
+    the task id and the PageStats of the page."""
+    (task_id, index, hashed_seed, num, mode, size, glyphs, boxes, stats,
+     page_name, canvas_name) = task
+    page_block = shared_memory.SharedMemory(page_name)
+    try:
+        data = _read_block(page_block, _count_nbytes(mode, size))
+    finally:
+        page_block.close()
+    page = Page.from_image(PIL.Image.frombytes(mode, size, data), num)
+    if glyphs is not None:
+        template = _renderers[index].get_template(num)
+        page.glyphs = []
+        for xy, (font_size, char) in glyphs:
+            font = template.get_font_variant(font_size)
+            page.glyphs.append((_glyphs.get(font, char), xy, (font_size, char)))
+    page.boxes = boxes
+    page.stats = stats
+    data = _renderers[index].render(page, hashed_seed).tobytes()
+    canvas_block = shared_memory.SharedMemory(canvas_name)
+    try:
+        canvas_block.buf[:len(data)] = data
+    finally:
+        canvas_block.close()
+    return task_id, stats
+
+
+def _read_block(block: shared_memory.SharedMemory, nbytes: int) -> bytes:
+    """Copies the first nbytes of block. The view of the block is released
+    before returning, so that the block could be closed then. Pillow before 10
+    does not decode from memoryviews, hence the copy."""
+    view = block.buf[:nbytes]
+    try:
+        return bytes(view)
+    finally:
+        view.release()
+
+
+def _like_background(
+        image: PIL.Image.Image, background: PIL.Image.Image
+) -> PIL.Image.Image:
+    """Applies the palette and the info of background to image decoded from the
+    raw bytes of a canvas, which is what copying background would keep."""
+    if background.mode in ("P", "PA"):
+        rawmode = background.palette.mode
+        try:
+            palette = background.getpalette(rawmode)
+        except TypeError:
+            # Pillow before 9.1 only returns the RGB palette
+            palette, rawmode = background.getpalette(), "RGB"
+        image.putpalette(palette, rawmode)
+    image.info = background.info.copy()
+    return image
+
+
+def _count_nbytes(mode: str, size: Tuple[int, int]) -> int:
+    """Returns the length of the raw bytes of the images in mode and size."""
+    width, height = size
+    return len(PIL.Image.new(mode, (width, 1)).tobytes()) * height
+
+
+def _create_block(size: int) -> shared_memory.SharedMemory:
+    return shared_memory.SharedMemory(create=True, size=max(size, 1))
+
+
+def _destroy_block(block: shared_memory.SharedMemory) -> None:
+    block.close()
+    block.unlink()
@@ -0,0 +1,259 @@
+# coding: utf-8
+import concurrent.futures
+import io
+import os
+import zlib
+
+from PIL import TiffImagePlugin
+
+from handright._util import *
+
+_DEFAULT_PDF_RESOLUTION = 72.0
+_DEFAULT_JPEG_QUALITY = 75
+_DEFAULT_PNG_NAME = "{:04d}.png"
+
+_PDF_POINTS_PER_INCH = 72.0
+
+
+def save_pdf(
+        images: Iterable[PIL.Image.Image],
+        fp,
+        resolution: float = _DEFAULT_PDF_RESOLUTION,
+        quality: int = _DEFAULT_JPEG_QUALITY,
+        workers: Optional[int] = None,
+) -> int:
+    """Saves `images`, e.g. the output of `handright.handwrite`, as the pages of
+    a PDF file, and returns the number of the pages.
+
+    The images are consumed one by one and encoded in a thread pool of
+    `workers` threads while the next ones are being produced. Only a few images
+    are kept in memory at any time. `fp` could be a filename or a binary file
+    object, which need not be seekable.
+
+    `resolution` is the dots per inch of the images. The images in mode "1" are
+    compressed losslessly, and the others are compressed as JPEG of `quality`
+    after being converted to mode "L" or "RGB" if necessary.
+    """
+    with _open(fp, "wb") as f:
+        writer = _PdfWriter(f)
+        for encoded in _map_in_threads(
+                lambda im: _encode_pdf_image(im, quality), images, workers
+        ):
+            writer.write_page(encoded, resolution)
+        writer.close()
+        return writer.count()
+
+
+def save_tiff(
+        images: Iterable[PIL.Image.Image],
+        fp,
+        workers: Optional[int] = None,
+        **params,
+) -> int:
+    """Saves `images`, e.g. the output of `handright.handwrite`, as the frames
+    of a multi-page TIFF file, and returns the number of the frames.
+
+    The images are consumed one by one and encoded in a thread pool of
+    `workers` threads while the next ones are being produced. Only a few images
+    are kept in memory at any time. `fp` could be a filename or a binary file
+    object opened for both reading and writing, e.g. in mode "w+b".
+
+    `params` are passed to Pillow's TIFF encoder, e.g.
+    `compression="tiff_deflate"`.
+    """
+    count = 0
+    with _open(fp, "w+b") as f:
+        with TiffImagePlugin.AppendingTiffWriter(f, new=True) as tiff:
+            for data in _map_in_threads(
+                    lambda im: _encode(im, "TIFF", params), images, workers
+            ):
+                tiff.write(data)
+                tiff.newFrame()
+                count += 1
+    return count
+
+
+def save_pngs(
+        images: Iterable[PIL.Image.Image],
+        directory,
+        name: str = _DEFAULT_PNG_NAME,
+        workers: Optional[int] = None,
+        **params,
+) -> int:
+    """Saves each of `images`, e.g. the output of `handright.handwrite`, as a
+    PNG file in `directory`, and returns the number of the files.
+
+    The file of the page numbered `num` (counting from 0) is named
+    `name.format(num)`. The directory is created if it does not exist.
+
+    The images are consumed one by one and saved in a thread pool of `workers`
+    threads while the next ones are being produced. Only a few images are kept
+    in memory at any time. `params` are passed to Pillow's PNG encoder, e.g.
+    `compress_level=1`.
+    """
+    os.makedirs(directory, exist_ok=True)
+
+    def save(numbered):
+        num, image = numbered
+        image.save(os.path.join(directory, name.format(num)), "PNG", **params)
+
+    count = 0
+    for _ in _map_in_threads(save, enumerate(images), workers):
+        count += 1
+    return count
+
+
+def _map_in_threads(
+        func: Callable, items: Iterable, workers: Optional[int]
+) -> Iterator:
+    """The same as `map(func, items)`, but calls func in a thread pool of
+    `workers` threads, and keeps at most twice as many items in flight. The
+    consumed items are not referenced any more once func returns."""
+    if workers is None:
+        workers = os.cpu_count() or 1
+    maxsize = 2 * workers
+    with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+        futures = collections.deque()
+        try:
+            for item in items:
+                futures.append(executor.submit(func, item))
+                del item
+                if len(futures) >= maxsize:
+                    yield futures.popleft().result()
+            while futures:
+                yield futures.popleft().result()
+        finally:
+            for future in futures:
+                future.cancel()
+
+
+def _open(fp, mode: str):
+    """Opens fp if it is a filename, otherwise wraps the file object without
+    closing it."""
+    if isinstance(fp, (str, bytes, os.PathLike)):
+        return open(fp, mode)
+    return _Unclosed(fp)
+
+
+class _Unclosed(object):
+    __slots__ = ("_file",)
+
+    def __init__(self, file) -> None:
+        self._file = file
+
+    def __enter__(self):
+        return self._file
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self._file.flush()
+
+
+def _encode(image: PIL.Image.Image, format_: str, params) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, format_, **params)
+    return buffer.getvalue()
+
+
+def _encode_pdf_image(
+        image: PIL.Image.Image, quality: int
+) -> Tuple[Tuple[int, int], str, int, str, bytes]:
+    """Returns the size, the color space, the bits per component, the filter
+    and the data of the image XObject of `image`."""
+    if image.mode == "1":
+        return (image.size, "DeviceGray", 1, "FlateDecode",
+                zlib.compress(image.tobytes()))
+    if image.mode != "L":
+        image = image.convert("RGB")
+    color_space = "DeviceGray" if image.mode == "L" else "DeviceRGB"
+    data = _encode(image, "JPEG", {"quality": quality})
+    return image.size, color_space, 8, "DCTDecode", data
+
+
+class _PdfWriter(object):
+    """Writes the pages of a PDF file one by one. The page tree is written at
+    the end, so that only the object numbers of the pages are kept."""
+
+    __slots__ = ("_file", "_offsets", "_pages", "_position", "_next")
+
+    # the object numbers reserved for the catalog and the page tree
+    _CATALOG = 1
+    _PAGES = 2
+
+    def __init__(self, file) -> None:
+        self._file = file
+        self._offsets = {}  # object number -> offset
+        self._pages = []  # the object numbers of the pages
+        self._position = 0
+        self._next = self._PAGES + 1  # the next object number to allocate
+        self._write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+
+    def count(self) -> int:
+        return len(self._pages)
+
+    def write_page(self, encoded, resolution: float) -> None:
+        (width, height), color_space, bits, filter_, data = encoded
+        image = self._next_number()
+        self._write_object(image, (
+            "<< /Type /XObject /Subtype /Image /Width {} /Height {} "
+            "/ColorSpace /{} /BitsPerComponent {} /Filter /{} /Length {} >>"
+        ).format(width, height, color_space, bits, filter_, len(data)), data)
+
+        scale = _PDF_POINTS_PER_INCH / resolution
+        size = "{:.4f} 0 0 {:.4f}".format(width * scale, height * scale)
+        content = "q {} 0 0 cm /Im Do Q".format(size).encode()
+        contents = self._next_number()
+        self._write_object(
+            contents, "<< /Length {} >>".format(len(content)), content
+        )
+
+        page = self._next_number()
+        self._write_object(page, (
+            "<< /Type /Page /Parent {} 0 R /MediaBox [0 0 {:.4f} {:.4f}] "
+            "/Resources << /XObject << /Im {} 0 R >> >> /Contents {} 0 R >>"
+        ).format(self._PAGES, width * scale, height * scale, image, contents))
+        self._pages.append(page)
+
+    def close(self) -> None:
+        """Writes the page tree, the catalog and the trailer."""
+        kids = " ".join("{} 0 R".format(p) for p in self._pages)
+        self._write_object(
+            self._PAGES,
+            "<< /Type /Pages /Kids [{}] /Count {} >>".format(
+                kids, len(self._pages)
+            ),
+        )
+        self._write_object(
+            self._CATALOG,
+            "<< /Type /Catalog /Pages {} 0 R >>".format(self._PAGES),
+        )
+        size = self._next
+        xref = self._position
+        lines = ["xref", "0 {}".format(size), "0000000000 65535 f "]
+        for number in range(1, size):
+            lines.append("{:010d} 00000 n ".format(self._offsets[number]))
+        lines.append("trailer")
+        lines.append("<< /Size {} /Root {} 0 R >>".format(size, self._CATALOG))
+        lines.append("startxref")
+        lines.append(str(xref))
+        lines.append("%%EOF\n")
+        self._write("\n".join(lines).encode())
+
+    def _next_number(self) -> int:
+        number = self._next
+        self._next += 1
+        return number
+
+    def _write_object(
+            self, number: int, dictionary: str, stream: Optional[bytes] = None
+    ) -> None:
+        self._offsets[number] = self._position
+        self._write("{} 0 obj\n{}\n".format(number, dictionary).encode())
+        if stream is not None:
+            self._write(b"stream\n")
+            self._write(stream)
+            self._write(b"\nendstream\n")
+        self._write(b"endobj\n")
+
+    def _write(self, data: bytes) -> None:
+        self._file.write(data)
+        self._position += len(data)
@@ -1,5 +1,9 @@
 # coding: utf-8
 import copy
+import hashlib
+import io
+
+import PIL.ImageFont
 
 from handright._util import *
 
@@ -8,8 +12,13 @@ class Feature(object):
     """**EXPERIMENT**
     The extra features.
     GRID_LAYOUT: use grid layout, default use flow layout.
+    GLYPH_STROKES: extract the strokes of each distinct glyph only once and
+    reuse them for all its occurrences, instead of scanning the whole pages.
+    The strokes are perturbed in the order of chars rather than the order of
+    pixels, so the outputs differ from the default ones.
     """
     GRID_LAYOUT = 1
+    GLYPH_STROKES = 2
 
 
 class Template(object):
@@ -33,6 +42,7 @@ class Template(object):
         "_perturb_y_sigma",
         "_perturb_theta_sigma",
         "_features",
+        "_font_variants",
     )
 
     _DEFAULT_WORD_SPACING = 0
@@ -49,6 +59,8 @@ class Template(object):
 
     _DEFAULT_FEATURES = frozenset()
 
+    _FONT_VARIANTS_MAXSIZE = 128
+
     def __init__(
             self,
             background: PIL.Image.Image,
@@ -151,6 +163,7 @@ class Template(object):
 
     def set_font(self, font) -> None:
         self._font = font
+        self._font_variants = LRUCache(self._FONT_VARIANTS_MAXSIZE)
 
     def set_fill(self, fill=None) -> None:
         if fill is None:
@@ -246,6 +259,21 @@ class Template(object):
     def get_font(self):
         return self._font
 
+    def get_font_variant(self, size: int):
+        """Returns the font with the same typeface as `font` but in `size`. The
+        variants are cached by the template, so that they could be reused
+        across chars, pages and calls."""
+        if size == self._font.size:
+            return self._font
+        return self._font_variants.get(
+            size, lambda: self._font.font_variant(size=size)
+        )
+
+    def get_font_variant_info(self) -> CacheInfo:
+        """Returns the CacheInfo of the font variants cached by the template,
+        whose misses count the variants created."""
+        return self._font_variants.cache_info()
+
     def get_fill(self):
         return self._fill
 
@@ -294,6 +322,11 @@ class Template(object):
     def get_size(self) -> Tuple[int, int]:
         return self.get_background().size
 
+    def compile(self) -> "CompiledTemplate":
+        """Returns an immutable snapshot of the template, see
+        `handright.CompiledTemplate`."""
+        return CompiledTemplate(self)
+
     def release_font_resource(self) -> None:
         """This method should be called before pickling corresponding instances.
         After that, the font property will become unavailable.
@@ -324,5 +357,256 @@ class Template(object):
                 ).format(class_name=class_name, self=self)
 
 
+class CompiledTemplate(object):
+    """An immutable snapshot of a Template, created by `Template.compile()`.
+
+    The parameters are plain read-only attributes with the same names as the
+    ones of Template, and the constants of layout are computed in advance. A
+    CompiledTemplate is hashable and compared by its `digest()`, which is
+    stable across processes as long as its font is loaded from a file or bytes.
+    Pickling a CompiledTemplate only keeps the file path or the bytes of its
+    font rather than the font object.
+
+    Note that the background is not copied, so it must not be modified after
+    compiling.
+    """
+
+    __slots__ = (
+        "background",
+        "fill",
+        "size",
+        "width",
+        "height",
+        "font_size",
+        "line_spacing",
+        "left_margin",
+        "top_margin",
+        "right_margin",
+        "bottom_margin",
+        "word_spacing",
+        "line_spacing_sigma",
+        "font_size_sigma",
+        "word_spacing_sigma",
+        "start_chars",
+        "end_chars",
+        "perturb_x_sigma",
+        "perturb_y_sigma",
+        "perturb_theta_sigma",
+        "features",
+        "grid_layout",
+        "glyph_strokes",
+        # the constants of layout
+        "first_line_y",
+        "last_line_y",
+        "start_chars_x",
+        "end_chars_x",
+        "grid_step",
+        # the font, which is loaded from _font_spec on demand if None
+        "_font",
+        "_font_spec",
+        "_font_variants",
+        "_digest",
+    )
+
+    def __init__(self, template: Template) -> None:
+        font = template.get_font()
+        values = dict(
+            background=template.get_background(),
+            fill=template.get_fill(),
+            line_spacing=template.get_line_spacing(),
+            left_margin=template.get_left_margin(),
+            top_margin=template.get_top_margin(),
+            right_margin=template.get_right_margin(),
+            bottom_margin=template.get_bottom_margin(),
+            word_spacing=template.get_word_spacing(),
+            line_spacing_sigma=template.get_line_spacing_sigma(),
+            font_size_sigma=template.get_font_size_sigma(),
+            word_spacing_sigma=template.get_word_spacing_sigma(),
+            start_chars=template.get_start_chars(),
+            end_chars=template.get_end_chars(),
+            perturb_x_sigma=template.get_perturb_x_sigma(),
+            perturb_y_sigma=template.get_perturb_y_sigma(),
+            perturb_theta_sigma=template.get_perturb_theta_sigma(),
+            features=frozenset(template.get_features()),
+            font_size=None if font is None else font.size,
+        )
+        self._init(values, font, _font_spec(font), template._font_variants)
+
+    def _init(self, values, font, font_spec, font_variants) -> None:
+        set_ = super().__setattr__
+        for name, value in values.items():
+            set_(name, value)
+        set_("_font", font)
+        set_("_font_spec", font_spec)
+        set_("_font_variants", font_variants)
+        set_("_digest", None)
+
+        size = self.background.size
+        set_("size", size)
+        set_("width", size[0])
+        set_("height", size[1])
+        set_("grid_layout", Feature.GRID_LAYOUT in self.features)
+        set_("glyph_strokes", Feature.GLYPH_STROKES in self.features)
+        if self.font_size is None:
+            for name in ("first_line_y", "last_line_y", "start_chars_x",
+                         "end_chars_x", "grid_step"):
+                set_(name, None)
+            return
+        set_("first_line_y", self.top_margin + self.line_spacing
+             - self.font_size)
+        set_("last_line_y", self.height - self.bottom_margin - self.font_size)
+        set_("start_chars_x", self.width - self.right_margin
+             - 2 * self.font_size)
+        set_("end_chars_x", self.width - self.right_margin - self.font_size)
+        set_("grid_step", self.word_spacing + self.font_size)
+
+    def __setattr__(self, name, value) -> None:
+        raise AttributeError("CompiledTemplate is immutable")
+
+    def __delattr__(self, name) -> None:
+        raise AttributeError("CompiledTemplate is immutable")
+
+    @property
+    def font(self):
+        """The font, which is reloaded after unpickling if possible, otherwise
+        None."""
+        if self._font is None and self._font_spec is not None:
+            super().__setattr__("_font", _load_font(self._font_spec))
+        return self._font
+
+    def get_font_variant(self, size: int):
+        """The same as `Template.get_font_variant`, which shares the cached
+        variants with the Template compiled."""
+        if size == self.font_size:
+            return self.font
+        return self._font_variants.get(
+            size, lambda: self.font.font_variant(size=size)
+        )
+
+    def get_font_variant_info(self) -> CacheInfo:
+        return self._font_variants.cache_info()
+
+    def digest(self) -> str:
+        """Returns the hex digest of the SHA-256 of the background, the font and
+        all the other parameters."""
+        if self._digest is None:
+            super().__setattr__("_digest", self._compute_digest())
+        return self._digest
+
+    def _compute_digest(self) -> str:
+        sha = hashlib.sha256()
+        background = self.background
+        sha.update(repr((
+            background.mode,
+            background.size,
+            background.getpalette() if background.palette else None,
+            _font_identity(self._font_spec, self._font),
+            self.font_size,
+            self._values(),
+        )).encode())
+        sha.update(background.tobytes())
+        return sha.hexdigest()
+
+    def _values(self) -> dict:
+        return {
+            "fill": self.fill,
+            "line_spacing": self.line_spacing,
+            "left_margin": self.left_margin,
+            "top_margin": self.top_margin,
+            "right_margin": self.right_margin,
+            "bottom_margin": self.bottom_margin,
+            "word_spacing": self.word_spacing,
+            "line_spacing_sigma": self.line_spacing_sigma,
+            "font_size_sigma": self.font_size_sigma,
+            "word_spacing_sigma": self.word_spacing_sigma,
+            "start_chars": self.start_chars,
+            "end_chars": self.end_chars,
+            "perturb_x_sigma": self.perturb_x_sigma,
+            "perturb_y_sigma": self.perturb_y_sigma,
+            "perturb_theta_sigma": self.perturb_theta_sigma,
+            "features": sorted(self.features),
+        }
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, CompiledTemplate):
+            return NotImplemented
+        return self is other or self.digest() == other.digest()
+
+    def __hash__(self) -> int:
+        return hash(self.digest())
+
+    def __reduce__(self):
+        values = self._values()
+        values["features"] = self.features
+        values["background"] = self.background
+        values["font_size"] = self.font_size
+        return _restore, (values, self._font_spec, self._digest)
+
+    def __repr__(self) -> str:
+        return "{}(background={}, font={}, {})".format(
+            type(self).__name__,
+            self.background,
+            self._font,
+            ", ".join(
+                "{}={!r}".format(k, v) for k, v in self._values().items()
+            ),
+        )
+
+
+# the templates accepted by the handwriting functions
+TemplateLike = Union[Template, CompiledTemplate]
+
+
+def _restore(values, font_spec, digest) -> CompiledTemplate:
+    template = CompiledTemplate.__new__(CompiledTemplate)
+    template._init(
+        values, None, font_spec, LRUCache(Template._FONT_VARIANTS_MAXSIZE)
+    )
+    object.__setattr__(template, "_digest", digest)
+    return template
+
+
+def _font_spec(font) -> Optional[tuple]:
+    """Returns the picklable arguments to reload font, or None if it could not
+    be reloaded."""
+    if font is None or not hasattr(font, "size"):
+        return None
+    path = getattr(font, "path", None)
+    font_bytes = getattr(font, "font_bytes", None)
+    if isinstance(path, (str, bytes)):
+        font_bytes = None
+    elif font_bytes is not None:
+        path = None
+    else:
+        return None
+    return (
+        path,
+        font_bytes,
+        font.size,
+        getattr(font, "index", 0),
+        getattr(font, "encoding", ""),
+        getattr(font, "layout_engine", None),
+    )
+
+
+def _font_identity(spec: Optional[tuple], font) -> tuple:
+    """Returns the part of the digest of CompiledTemplate for font."""
+    if spec is None:
+        # not stable across processes
+        return "id", id(font)
+    path, font_bytes, *rest = spec
+    if font_bytes is not None:
+        return ("sha256", hashlib.sha256(font_bytes).hexdigest(), *rest)
+    return ("path", path, *rest)
+
+
+def _load_font(spec: tuple):
+    path, font_bytes, size, index, encoding, layout_engine = spec
+    source = path if font_bytes is None else io.BytesIO(font_bytes)
+    return PIL.ImageFont.truetype(
+        source, size, index, encoding, layout_engine=layout_engine
+    )
+
+
 def copy_templates(templates: Iterable[Template]) -> Tuple[Template, ...]:
     return tuple(map(copy.copy, templates))
@@ -1,7 +1,8 @@
 # coding: utf-8
-import array
-import collections.abc
+import collections
+import queue
 import random
+import threading
 from typing import *
 
 import PIL.Image
@@ -23,7 +24,7 @@ def count_bands(mode: str) -> int:
 class Page(object):
     """A simple wrapper for Pillow Image Object"""
 
-    __slots__ = ("image", "num")
+    __slots__ = ("image", "num", "glyphs", "boxes", "stats", "lines")
 
     def __init__(
             self,
@@ -34,6 +35,27 @@ class Page(object):
     ) -> None:
         self.image = PIL.Image.new(mode, size, color)
         self.num = num
+        # the (glyph, position, (font size, char)) of the glyphs drawn onto the
+        # page, if recorded
+        self.glyphs = None
+        # the boxes of the ink drawn onto the page, if recorded
+        self.boxes = None
+        # the PageStats of the page, if recorded
+        self.stats = None
+        # the (start, end, y) of the lines of the page, if recorded
+        self.lines = None
+
+    @classmethod
+    def from_image(cls, image: PIL.Image.Image, num: int) -> "Page":
+        """Wraps an existing image without copying it."""
+        page = cls.__new__(cls)
+        page.image = image
+        page.num = num
+        page.glyphs = None
+        page.boxes = None
+        page.stats = None
+        page.lines = None
+        return page
 
     def draw(self):
         return PIL.ImageDraw.Draw(self.image)
@@ -51,56 +73,294 @@ class Page(object):
         return self.image.height
 
 
-class NumericOrderedSet(collections.abc.Collection):
-    """A mutable set storing numeric value that remembers its elements insert
-    order. Note that, this data structure has not implemented the full
-    interfaces of collections.abc.MutableSet or collections.abc.Set. For
-    simplicity, it only implements collections.abc.Collection, add method and
-    other customized methods."""
-
-    __slots__ = ("_typecode", "_privileged", "_array", "_set")
-
-    def __init__(self, typecode: str, privileged=None) -> None:
-        """More info about typecode: https://docs.python.org/3/library/array.html#module-array
-        The value of privileged must be within the typecode's range. The
-        privileged can be successfully added more than one time to this data
-        structure and appear more than one time in the ordered sequence."""
-        self._typecode = typecode
-        self._privileged = privileged
-        self._array = array.array(typecode)
-        self._set = set()
-
-    def add(self, item) -> bool:
-        """This has no effect and would return False if the item is not equal to
-        privileged and already present. Otherwise, it will adds the item and
-        returns True."""
-        if item != self._privileged and item in self._set:
+class PageStats(object):
+    """The statistics of handwriting a page.
+
+    The times are wall times in seconds. `layout_time` is the time of drafting
+    the page excluding `glyph_time`, the time of drawing the glyphs. The time
+    of rendering the page is split into `extraction_time` of extracting the
+    strokes, `perturbation_time` of perturbing them, `background_time` of
+    copying the background, and `merge_time` of filling the perturbed strokes
+    onto the copy.
+
+    `chars` is the number of the chars placed on the page, `strokes` is the
+    number of the strokes found, `ink_pixels` is the number of the pixels of
+    the strokes before perturbation, and `font_variants` is the number of the
+    font variants created while drafting the page.
+    """
+
+    __slots__ = (
+        "num",
+        "layout_time",
+        "glyph_time",
+        "extraction_time",
+        "perturbation_time",
+        "background_time",
+        "merge_time",
+        "chars",
+        "strokes",
+        "ink_pixels",
+        "font_variants",
+    )
+
+    def __init__(self, num: int) -> None:
+        self.num = num
+        self.layout_time = 0.0
+        self.glyph_time = 0.0
+        self.extraction_time = 0.0
+        self.perturbation_time = 0.0
+        self.background_time = 0.0
+        self.merge_time = 0.0
+        self.chars = 0
+        self.strokes = 0
+        self.ink_pixels = 0
+        self.font_variants = 0
+
+    def __repr__(self) -> str:
+        fields = ", ".join(
+            "{}={!r}".format(k, getattr(self, k)) for k in self.__slots__
+        )
+        return "{}({})".format(type(self).__name__, fields)
+
+
+class PageLayout(object):
+    """The layout of a page, i.e. where the text goes without rendering it.
+
+    The chars of the page are `text[start:end]` and the chars of each line are
+    `text[line_start:line_end]` for each `(line_start, line_end, y)` in `lines`,
+    where `text` is the whole text with all the line separators replaced by
+    "\\n", and `y` is the vertical position of the line before adding the
+    random line spacing. The line breaks are included in the ranges.
+    """
+
+    __slots__ = ("num", "start", "end", "lines")
+
+    def __init__(
+            self,
+            num: int,
+            start: int,
+            end: int,
+            lines: Sequence[Tuple[int, int, int]],
+    ) -> None:
+        self.num = num
+        self.start = start
+        self.end = end
+        self.lines = lines
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, PageLayout):
+            return NotImplemented
+        return ((self.num, self.start, self.end, self.lines)
+                == (other.num, other.start, other.end, other.lines))
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        return "{}(num={!r}, start={!r}, end={!r}, lines={!r})".format(
+            type(self).__name__, self.num, self.start, self.end, self.lines
+        )
+
+
+class PixelSet(object):
+    """A set of the pixels within a box, which takes only one bit per pixel."""
+
+    __slots__ = ("_box", "_width", "_bits")
+
+    def __init__(self, box: Tuple[int, int, int, int]) -> None:
+        left, upper, right, lower = box
+        self._box = box
+        self._width = right - left
+        self._bits = bytearray(((right - left) * (lower - upper) + 7) // 8)
+
+    def add(self, x: int, y: int) -> bool:
+        """Adds the pixel, and returns False if it is already present."""
+        i = (y - self._box[1]) * self._width + x - self._box[0]
+        mask = 1 << (i & 7)
+        if self._bits[i >> 3] & mask:
             return False
-        self._set.add(item)
-        self._array.append(item)
+        self._bits[i >> 3] |= mask
+        return True
+
+    def __contains__(self, xy: Tuple[int, int]) -> bool:
+        i = (xy[1] - self._box[1]) * self._width + xy[0] - self._box[0]
+        return bool(self._bits[i >> 3] & (1 << (i & 7)))
+
+    def box(self) -> Tuple[int, int, int, int]:
+        return self._box
+
+
+def iterate_in_thread(iterable: Iterable, maxsize: int) -> Iterator:
+    """Iterates `iterable` in a background thread, which runs ahead of the
+    consumer by at most `maxsize` items. The exceptions are re-raised in the
+    consumer."""
+    items = queue.Queue(maxsize)
+    stopped = threading.Event()
+    thread = threading.Thread(
+        target=_produce, args=(iterable, items, stopped), daemon=True
+    )
+    thread.start()
+    try:
+        while True:
+            item, error = items.get()
+            if item is _END:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        stopped.set()
+
+
+_END = object()
+_PUT_TIMEOUT = 0.1
+
+
+def _produce(iterable: Iterable, items: queue.Queue, stopped) -> None:
+    try:
+        for item in iterable:
+            if not _put(items, (item, None), stopped):
+                return
+    except BaseException as e:
+        _put(items, (_END, e), stopped)
+    else:
+        _put(items, (_END, None), stopped)
+
+
+def _put(items: queue.Queue, item, stopped) -> bool:
+    """Puts item into items unless the consumer has stopped, and returns whether
+    the item is put."""
+    while not stopped.is_set():
+        try:
+            items.put(item, timeout=_PUT_TIMEOUT)
+        except queue.Full:
+            continue
         return True
+    return False
+
+
+CacheInfo = collections.namedtuple(
+    "CacheInfo", ("hits", "misses", "maxsize", "currsize")
+)
+
 
-    def add_privileged(self) -> None:
-        """Equivalent to add(privileged)"""
-        self._set.add(self._privileged)
-        self._array.append(self._privileged)
+class LRUCache(object):
+    """A thread-safe cache with bounded size, which discards the least recently
+    used items first."""
 
-    def __contains__(self, item) -> bool:
-        return item in self._set
+    __slots__ = ("_maxsize", "_items", "_lock", "_hits", "_misses")
 
-    def __iter__(self):
-        return iter(self._array)
+    def __init__(self, maxsize: int) -> None:
+        self._maxsize = maxsize
+        self._items = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def __reduce__(self):
+        # the items and the lock are not picklable in general
+        return type(self), (self._maxsize,)
+
+    def get(self, key, factory: Callable[[], Any]):
+        """Returns the item of key. If missing, creates the item by calling
+        factory and caches it."""
+        with self._lock:
+            try:
+                item = self._items[key]
+            except KeyError:
+                pass
+            else:
+                self._hits += 1
+                self._items.move_to_end(key)
+                return item
+            self._misses += 1
+            item = factory()
+            if self._maxsize > 0:
+                self._items[key] = item
+                if len(self._items) > self._maxsize:
+                    self._items.popitem(last=False)
+            return item
 
     def clear(self) -> None:
-        self._set.clear()
-        self._array = array.array(self._typecode)
+        """Clears the cache and the statistics."""
+        with self._lock:
+            self._items.clear()
+            self._hits = 0
+            self._misses = 0
+
+    def cache_info(self) -> CacheInfo:
+        with self._lock:
+            return CacheInfo(
+                self._hits, self._misses, self._maxsize, len(self._items)
+            )
 
     def __len__(self) -> int:
-        """The length of ordered sequence"""
-        return len(self._array)
+        return len(self._items)
+
+
+class BufferPool(object):
+    """A thread-safe pool of the images to be reused, which are grouped by mode
+    and size.
+
+    A BufferPool could be passed to `handright.handwrite()` to reuse the
+    bitmaps of the drafted pages and the canvases of the output pages instead
+    of allocating new ones. The output images are only reused after being
+    released by `BufferPool.release`, and they must not be used any more since
+    then.
+    """
+
+    __slots__ = ("_maxsize", "_canvases", "_drafts", "_lock")
+
+    DEFAULT_MAXSIZE = 4
+
+    def __init__(self, maxsize: int = DEFAULT_MAXSIZE) -> None:
+        """`maxsize` is the maximum number of the idle images kept for each
+        mode and size, for the canvases and the drafts respectively."""
+        self._maxsize = maxsize
+        self._canvases = {}  # (mode, size) -> list of the released canvases
+        self._drafts = {}  # (mode, size) -> list of the reset drafts
+        self._lock = threading.Lock()
+
+    def __reduce__(self):
+        # the images and the lock are not picklable in general
+        return type(self), (self._maxsize,)
+
+    def release(self, image: PIL.Image.Image) -> None:
+        """Returns an output image which is no longer used to the pool."""
+        self._put(self._canvases, image)
+
+    def acquire_canvas(
+            self, mode: str, size: Tuple[int, int]
+    ) -> Optional[PIL.Image.Image]:
+        """Returns a released canvas in mode and size, whose content is
+        undefined, or None if there is no such canvas."""
+        return self._take(self._canvases, mode, size)
+
+    def acquire_draft(
+            self, mode: str, size: Tuple[int, int]
+    ) -> Optional[PIL.Image.Image]:
+        """Returns a draft released by `BufferPool.release_draft` in mode and
+        size, or None if there is no such draft."""
+        return self._take(self._drafts, mode, size)
+
+    def release_draft(self, image: PIL.Image.Image) -> None:
+        """Returns a draft bitmap to the pool, which must have been reset to the
+        blank one by the caller."""
+        self._put(self._drafts, image)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._canvases.clear()
+            self._drafts.clear()
 
-    def typecode(self) -> str:
-        return self._typecode
+    def _take(self, images, mode, size) -> Optional[PIL.Image.Image]:
+        with self._lock:
+            idle = images.get((mode, size))
+            if idle:
+                return idle.pop()
+            return None
 
-    def privileged(self):
-        return self._privileged
+    def _put(self, images, image: PIL.Image.Image) -> None:
+        with self._lock:
+            idle = images.setdefault((image.mode, image.size), [])
+            if len(idle) < self._maxsize:
+                idle.append(image)
@@ -0,0 +1,150 @@
+# coding: utf-8
+import random
+
+import PIL.Image
+import PIL.ImageDraw
+import pytest
+
+from handright._core import (
+    _draft,
+    _extract_glyph_strokes,
+    _extract_strokes,
+    _extract_strokes_by_dfs,
+    _extract_strokes_by_runs,
+    _extract_strokes_by_tiles,
+    _extract_strokes_in_tile,
+    _InkMask,
+    _ink_bands,
+    _perturb_strokes_by_array,
+    _perturb_strokes_by_loop,
+    _TextStream,
+)
+from handright._template import Feature, Template
+from handright._util import Page
+from tests.util import *
+
+
+def draw_text_bitmap() -> PIL.Image.Image:
+    image = PIL.Image.new("1", (160, 90), 0)
+    draw = PIL.ImageDraw.Draw(image)
+    draw.text((2, 2), "荷塘月色", fill=1, font=get_default_font(36))
+    draw.text((5, 45), "我能吞下玻璃", fill=1, font=get_default_font(23))
+    draw.line((0, 89, 159, 0), fill=1)
+    return image
+
+
+def to_pixel_lists(strokes):
+    return [sorted(zip(xs.tolist(), ys.tolist())) for xs, ys in strokes]
+
+
+def test_extract_strokes_by_runs():
+    pytest.importorskip("numpy")
+    image = draw_text_bitmap()
+    for bbox in (image.getbbox(), (3, 7, 150, 80)):
+        strokes1 = _extract_strokes_by_runs(image, bbox)
+        strokes2 = _extract_strokes_by_dfs(image.load(), bbox)
+        assert to_pixel_lists(strokes1) == to_pixel_lists(strokes2)
+
+
+def test_perturb_strokes_by_array():
+    pytest.importorskip("numpy")
+    image = draw_text_bitmap()
+    template = Template(
+        background=PIL.Image.new("RGB", image.size, "white"),
+        font=get_default_font(23),
+        perturb_x_sigma=3,
+        perturb_y_sigma=3,
+        perturb_theta_sigma=0.4,
+    ).compile()
+    bbox = image.getbbox()
+    strokes = _extract_strokes_by_runs(image, bbox)
+    rand = random.Random(1)
+    strokes1 = list(_perturb_strokes_by_array(strokes, template, rand))
+    strokes = _extract_strokes_by_dfs(image.load(), bbox)
+    rand = random.Random(1)
+    strokes2 = list(_perturb_strokes_by_loop(strokes, template, rand))
+    assert to_pixel_lists(strokes1) == [sorted(zip(*s)) for s in strokes2]
+    canvas1 = template.background.copy()
+    canvas2 = template.background.copy()
+    mask1 = _InkMask(canvas1, (0, 0, 0))
+    mask2 = _InkMask(canvas2, (0, 0, 0))
+    for (xs1, ys1), (xs2, ys2) in zip(strokes1, strokes2):
+        mask1.paint_by_array(xs1, ys1)
+        mask2.paint_by_loop(xs2, ys2)
+    mask1.flush()
+    mask2.flush()
+    assert canvas1 == canvas2
+    assert canvas1.getbbox() is not None
+
+
+def test_extract_strokes_by_tiles():
+    pytest.importorskip("numpy")
+    image = draw_text_bitmap()
+    bbox = image.getbbox()
+    criterion = to_pixel_lists(_extract_strokes_in_tile(image, bbox))
+    for tile_height in (1, 2, 7, 100):
+        strokes = _extract_strokes_by_tiles(image, bbox, tile_height)
+        assert to_pixel_lists(strokes) == criterion
+
+
+def test_extract_glyph_strokes():
+    template = Template(
+        background=PIL.Image.new("RGB", (100, 100), "white"),
+        font=get_default_font(20),
+        word_spacing=-6,
+        features={Feature.GLYPH_STROKES},
+    )
+    for page in _draft(get_long_text()[:200], (template,), seed=1):
+        strokes1 = _extract_glyph_strokes(page)
+        strokes2 = _extract_strokes(page.image, page.image.getbbox())
+        assert sorted(to_pixel_lists(strokes1)) == sorted(
+            to_pixel_lists(strokes2)
+        )
+
+
+def test_ink_bands():
+    page = Page("1", (100, 100), 0, 0)
+    assert _ink_bands(page, (0, 0, 100, 100)) == [(0, 0, 100, 100)]
+    page.boxes = [(50, 40, 60, 50), (10, 0, 20, 10), (0, 9, 30, 20),
+                  (5, 20, 8, 30), (90, 31, 120, 35), (0, 150, 10, 160)]
+    assert _ink_bands(page, (0, 0, 100, 100)) == [
+        (0, 0, 30, 30), (90, 31, 100, 35), (50, 40, 60, 50)
+    ]
+
+
+def test_extract_strokes_by_ink_bands():
+    template = Template(
+        background=PIL.Image.new("1", (200, 200), 1),
+        font=get_default_font(20),
+        line_spacing=45,
+    )
+    page = next(_draft(get_long_text(), (template,), seed=1))
+    bbox = page.image.getbbox()
+    assert len(_ink_bands(page, bbox)) > 1
+    strokes = []
+    for band in _ink_bands(page, bbox):
+        strokes.extend(_extract_strokes(page.image, band))
+    assert to_pixel_lists(strokes) == to_pixel_lists(
+        _extract_strokes(page.image, bbox)
+    )
+
+
+def test_text_stream_release():
+    text = _TextStream(("ab\r", "\ncd", "ef"))
+    text.release(4)
+    assert text[4] == "d"
+    assert not text.ends_at(6)
+    assert text.ends_at(7)
+
+
+def test_text_stream_release_amortized():
+    text = _TextStream(("abcdefgh",))
+    text.release(2)
+    assert len(text._buffer) == 8
+    assert text[2] == "c"
+    assert text.slice(2, 5) == "cde"
+    text.release(5)
+    assert len(text._buffer) == 3
+    assert text[5] == "f"
+    assert text.slice(5, 8) == "fgh"
+
@@ -0,0 +1,45 @@
+# coding: utf-8
+import PIL.Image
+import PIL.ImageDraw
+
+from handright._glyph import *
+from tests.util import *
+
+SIZE = (64, 48)
+
+
+def test_paste():
+    font = get_default_font(30)
+    cache = GlyphCache()
+    for char in "我能,。 a":
+        for xy in ((0, 0), (10, 5), (-7, -9), (50, 30)):
+            image1 = PIL.Image.new("1", SIZE, 0)
+            PIL.ImageDraw.Draw(image1).text(xy, char, fill=1, font=font)
+            image2 = PIL.Image.new("1", SIZE, 0)
+            cache.get(font, char).paste(image2, xy)
+            assert image1 == image2
+
+
+def test_advance():
+    font = get_default_font(30)
+    left, top, right, bottom = font.getbbox("能")
+    assert GlyphCache().get(font, "能").advance == right - left
+
+
+def test_advance_cache():
+    font = get_default_font(30)
+    glyphs = GlyphCache()
+    advances = AdvanceCache()
+    for char in "我能,。 a\t":
+        glyph = advances.get(font, char)
+        assert glyph.mask is None
+        assert glyph.advance == glyphs.get(font, char).advance
+
+
+def test_font_key():
+    cache = GlyphCache()
+    cache.get(get_default_font(10), "a")
+    cache.get(get_default_font(10), "a")
+    cache.get(get_default_font(11), "a")
+    hits, misses, maxsize, currsize = cache.cache_info()
+    assert (hits, misses, currsize) == (1, 2, 2)
@@ -1,11 +1,10 @@
 # coding: utf-8
+import time
+
 import PIL.Image
 
 from handright._util import *
 
-UNSIGNED_INT32 = "L"
-MAX_UNSIGNED_INT32_VALUE = 0xFFFFFFFF
-
 
 def test_count_bands():
     assert count_bands("1") == 1
@@ -54,48 +53,74 @@ def test_page_height():
     assert page.height() == size[1]
 
 
-def test_nos_privileged():
-    privileged = MAX_UNSIGNED_INT32_VALUE
-    nos = NumericOrderedSet(UNSIGNED_INT32, privileged)
-    assert privileged == nos.privileged()
-
-
-def test_nos_typecode():
-    nos = NumericOrderedSet(UNSIGNED_INT32)
-    assert nos.typecode() == UNSIGNED_INT32
-
-
-def test_nos_order_with_privileged():
-    privileged = MAX_UNSIGNED_INT32_VALUE
-    seq1 = list(range(10))
-    seq2 = list(range(10, 20, 2))
-    nos = NumericOrderedSet(UNSIGNED_INT32, privileged)
-    for i in seq1:
-        nos.add(i)
-    nos.add_privileged()
-    for i in seq2:
-        nos.add(i)
-    assert list(nos) == seq1 + [privileged] + seq2
-
-
-def test_nos_order():
-    nos = NumericOrderedSet(UNSIGNED_INT32)
-    for i in (0, 2, 1, 0, 9, 8, 2, 0):
-        nos.add(i)
-    assert tuple(nos) == (0, 2, 1, 9, 8)
-
-
-def test_nos_len():
-    privileged = MAX_UNSIGNED_INT32_VALUE
-    nos = NumericOrderedSet(UNSIGNED_INT32, privileged)
-    length = 10
-    for i in range(length):
-        assert len(nos) == i
-        assert nos.add(i)
-    assert len(nos) == length
-    nos.add_privileged()
-    assert len(nos) == length + 1
-    nos.add(privileged)
-    assert len(nos) == length + 2
-    nos.clear()
-    assert len(nos) == 0
+def test_pixel_set():
+    box = (3, 5, 13, 8)
+    pixels = PixelSet(box)
+    assert pixels.box() == box
+    for y in range(5, 8):
+        for x in range(3, 13):
+            assert (x, y) not in pixels
+            assert pixels.add(x, y)
+            assert (x, y) in pixels
+            assert not pixels.add(x, y)
+
+
+def test_pixel_set_isolation():
+    pixels = PixelSet((0, 0, 3, 3))
+    pixels.add(1, 1)
+    assert [(x, y) for y in range(3) for x in range(3)
+            if (x, y) in pixels] == [(1, 1)]
+
+
+def test_lru_cache():
+    cache = LRUCache(2)
+    assert cache.get(1, lambda: "a") == "a"
+    assert cache.get(2, lambda: "b") == "b"
+    assert cache.get(1, lambda: "c") == "a"
+    assert cache.get(3, lambda: "d") == "d"
+    assert cache.get(2, lambda: "e") == "e"
+    assert cache.cache_info() == CacheInfo(1, 4, 2, 2)
+    cache.clear()
+    assert cache.cache_info() == CacheInfo(0, 0, 2, 0)
+
+
+def test_lru_cache_zero_maxsize():
+    cache = LRUCache(0)
+    assert cache.get(1, lambda: "a") == "a"
+    assert cache.get(1, lambda: "b") == "b"
+    assert len(cache) == 0
+
+
+def test_iterate_in_thread():
+    assert list(iterate_in_thread(range(100), 3)) == list(range(100))
+    assert list(iterate_in_thread((), 1)) == []
+
+
+def test_iterate_in_thread_error():
+    def generate():
+        yield 1
+        raise ValueError()
+
+    it = iterate_in_thread(generate(), 1)
+    assert next(it) == 1
+    try:
+        next(it)
+    except ValueError:
+        pass
+    else:
+        assert False
+
+
+def test_iterate_in_thread_close():
+    produced = []
+
+    def generate():
+        for i in range(100):
+            produced.append(i)
+            yield i
+
+    it = iterate_in_thread(generate(), 2)
+    assert next(it) == 0
+    it.close()
+    time.sleep(0.3)
+    assert len(produced) < 100
@@ -29,6 +29,8 @@ def main():
             "Programming Language :: Python :: Implementation :: CPython",
         ],
         install_requires=("pillow >= 8.3.2, < 11",),
+        # NumPy speeds up the stroke extraction and perturbation a lot
+        extras_require={"fast": ("numpy",)},
         setup_requires=("setuptools>=38.6.0",),
     )
 
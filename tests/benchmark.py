@@ -0,0 +1,292 @@
+# coding: utf-8
+""" Benchmarking the speed and the memory usage of handwriting
+
+Run `python -m tests.benchmark --help` in the root of the repository for the
+usage. Each run of each case is measured in a fresh process, so that the caches
+and the peak memory of the runs do not affect each other.
+"""
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import time
+
+import PIL
+import PIL.Image
+
+import handright
+from handright import *
+from tests.util import *
+
+SEED = "Handright"
+
+# (width, height) of A4 paper in 150 and 300 dpi
+PAGE_SIZES = {"a4-150dpi": (1240, 1754), "a4-300dpi": (2480, 3508)}
+# font sizes relative to the page width
+FONT_SIZES = {"small": 1 / 40, "large": 1 / 20}
+SIGMAS = ("default", "zero")
+LAYOUTS = ("flow", "grid")
+PARALLELS = ("serial", "workers")
+
+# the stages recorded in PageStats
+STAGES = (
+    "layout", "glyph", "extraction", "perturbation", "background", "merge"
+)
+
+
+def main():
+    args = _parse_args()
+    cases = [
+        c for c in _all_cases()
+        if all(k in _case_name(c) for k in args.keyword)
+    ]
+    results = {"environment": _environment(), "cases": []}
+    for case in cases:
+        result = _measure(case, args)
+        results["cases"].append(result)
+        _print_result(result)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            _print_comparison(json.load(f), results)
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="python -m tests.benchmark", description=__doc__.split("\n")[0]
+    )
+    parser.add_argument(
+        "-k", "--keyword", action="append", default=[],
+        help="only run the cases whose names contain all the keywords",
+    )
+    parser.add_argument(
+        "-r", "--repeat", type=int, default=1,
+        help="the number of times of running each case, and the fastest one "
+             "is reported",
+    )
+    parser.add_argument(
+        "-w", "--workers", type=int, default=None,
+        help="the number of processes of the cases with workers, which "
+             "defaults to the number of CPUs",
+    )
+    parser.add_argument(
+        "--text", default="荷塘月色.txt",
+        help="the text under tests/texts to handwrite",
+    )
+    parser.add_argument(
+        "-o", "--output", help="the path to save the results as JSON"
+    )
+    parser.add_argument(
+        "-c", "--compare",
+        help="the path of the results saved before, e.g. by another version, "
+             "to compare with",
+    )
+    return parser.parse_args()
+
+
+def _all_cases():
+    for page, font, sigma, layout, parallel in itertools.product(
+            PAGE_SIZES, FONT_SIZES, SIGMAS, LAYOUTS, PARALLELS
+    ):
+        yield dict(page=page, font=font, sigma=sigma, layout=layout,
+                   parallel=parallel)
+
+
+def _case_name(case) -> str:
+    return "-".join(case[k] for k in ("page", "font", "sigma", "layout",
+                                      "parallel"))
+
+
+def _environment():
+    try:
+        import numpy
+        numpy_version = numpy.__version__
+    except ImportError:
+        numpy_version = None
+    return {
+        "handright": handright.__version__,
+        "python": platform.python_version(),
+        "pillow": PIL.__version__,
+        "numpy": numpy_version,
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def _measure(case, args):
+    workers = None
+    if case["parallel"] == "workers":
+        workers = args.workers or os.cpu_count()
+    best = None
+    for _ in range(max(args.repeat, 1)):
+        run = _run_in_process(_measure_run, case, args, workers)
+        if best is None or run["seconds"] < best["seconds"]:
+            best = run
+    return {
+        "name": _case_name(case),
+        "case": case,
+        "workers": workers,
+        "pages": best["pages"],
+        "pages_per_sec": best["pages"] / best["seconds"],
+        "seconds": best["seconds"],
+        "stage_seconds": _run_in_process(_measure_stages, case, args, workers),
+        "peak_rss_mib": best["peak_rss_mib"],
+        "peak_worker_rss_mib": best["peak_worker_rss_mib"],
+    }
+
+
+def _run_in_process(func, *args):
+    """Calls func(*args) in a fresh process, and returns the result."""
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+    # not daemonic, so that the cases with workers could start their own
+    # processes
+    process = multiprocessing.Process(
+        target=_call, args=(func, args, sender)
+    )
+    process.start()
+    sender.close()
+    result = receiver.recv()
+    process.join()
+    if isinstance(result, BaseException):
+        raise result
+    return result
+
+
+def _call(func, args, sender) -> None:
+    try:
+        result = func(*args)
+    except BaseException as e:
+        result = e
+    sender.send(result)
+    sender.close()
+
+
+def _measure_run(case, args, workers):
+    """Returns the seconds, the number of pages and the peak memory of
+    handwriting the text end to end."""
+    text = _read_text(args)
+    template = _get_template(case)
+    start = time.perf_counter()
+    num_pages = sum(1 for _ in handwrite(
+        text, template, seed=SEED, glyph_cache=GlyphCache(), workers=workers
+    ))
+    seconds = time.perf_counter() - start
+    # the workers have been joined once the iteration ends
+    return {
+        "seconds": seconds,
+        "pages": num_pages,
+        "peak_rss_mib": _peak_rss_mib("RUSAGE_SELF"),
+        "peak_worker_rss_mib": _peak_rss_mib("RUSAGE_CHILDREN"),
+    }
+
+
+def _measure_stages(case, args, workers):
+    """Returns the seconds spent in each stage summed over the pages, which are
+    recorded in PageStats. This slows down the handwriting slightly, hence a
+    separate run."""
+    text = _read_text(args)
+    template = _get_template(case)
+    times = dict.fromkeys(STAGES, 0.0)
+
+    def add(stats):
+        for stage in STAGES:
+            times[stage] += getattr(stats, stage + "_time")
+
+    for _ in handwrite(
+            text, template, seed=SEED, glyph_cache=GlyphCache(),
+            workers=workers, on_stats=add,
+    ):
+        pass
+    return times
+
+
+def _read_text(args) -> str:
+    with open(abs_path("texts", args.text), encoding="utf-8") as f:
+        return f.read()
+
+
+def _get_template(case) -> Template:
+    width, height = PAGE_SIZES[case["page"]]
+    font_size = round(width * FONT_SIZES[case["font"]])
+    kwargs = {}
+    if case["sigma"] == "zero":
+        kwargs = dict(
+            line_spacing_sigma=0,
+            font_size_sigma=0,
+            word_spacing_sigma=0,
+            perturb_x_sigma=0,
+            perturb_y_sigma=0,
+            perturb_theta_sigma=0,
+        )
+    features = set()
+    if case["layout"] == "grid":
+        features.add(Feature.GRID_LAYOUT)
+    return Template(
+        background=PIL.Image.new(mode="RGB", size=(width, height),
+                                 color="white"),
+        font=get_default_font(font_size),
+        line_spacing=font_size * 3 // 2,
+        left_margin=width // 10,
+        top_margin=height // 10,
+        right_margin=width // 10,
+        bottom_margin=height // 10,
+        word_spacing=font_size // 10,
+        features=features,
+        **kwargs,
+    )
+
+
+def _peak_rss_mib(who: str):
+    """Returns the peak resident set size in MiB of the current process if
+    `who` is "RUSAGE_SELF", or of the largest terminated child process if
+    "RUSAGE_CHILDREN", or None if it is unknown on the platform."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(getattr(resource, who)).ru_maxrss
+    # in bytes on macOS, and in kilobytes on the others
+    if sys.platform == "darwin":
+        return peak / (1 << 20)
+    return peak / (1 << 10)
+
+
+def _print_result(result) -> None:
+    seconds = result["stage_seconds"]
+    stages = " ".join("{}={:.3f}s".format(s, seconds[s]) for s in STAGES)
+    print("{}: {} pages, {:.3f} pages/s, {}, peak rss={}, "
+          "peak worker rss={}".format(
+              result["name"],
+              result["pages"],
+              result["pages_per_sec"],
+              stages,
+              _format_mib(result["peak_rss_mib"]),
+              _format_mib(result["peak_worker_rss_mib"]),
+          ))
+
+
+def _format_mib(mib) -> str:
+    return "unknown" if mib is None else "{:.1f}MiB".format(mib)
+
+
+def _print_comparison(old, new) -> None:
+    """Prints the ratios of the new pages/sec to the old ones."""
+    old_cases = {c["name"]: c for c in old["cases"]}
+    print("Compared with handright {}:".format(
+        old["environment"]["handright"]
+    ))
+    for case in new["cases"]:
+        if case["name"] in old_cases:
+            ratio = (case["pages_per_sec"]
+                     / old_cases[case["name"]]["pages_per_sec"])
+            print("{}: {:.2f}x".format(case["name"], ratio))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+# coding: utf-8
+import asyncio
+import concurrent.futures
+
+import PIL.Image
+
+from handright import *
+from tests.util import *
+
+SIZE = (32, 32)
+SEED = "Handright"
+
+
+def get_default_template() -> Template:
+    return Template(
+        background=PIL.Image.new(mode="RGB", size=SIZE, color="white"),
+        left_margin=3,
+        top_margin=6,
+        right_margin=3,
+        bottom_margin=6,
+        line_spacing=2,
+        font=get_default_font(2),
+    )
+
+
+async def collect(images, limit=None):
+    result = []
+    async for image in images:
+        result.append(image)
+        if len(result) == limit:
+            break
+    return result
+
+
+def test_ahandwrite():
+    text = get_long_text()
+    template = get_default_template()
+    criterion = list(handwrite(text, template, seed=SEED))
+    images = asyncio.run(collect(ahandwrite(text, template, seed=SEED)))
+    assert criterion == images
+
+
+def test_executor():
+    text = get_long_text()
+    template = get_default_template()
+    criterion = list(handwrite(text, template, seed=SEED))
+    with concurrent.futures.ThreadPoolExecutor(4) as executor:
+        images = ahandwrite(
+            text, template, seed=SEED, executor=executor, prefetch=4
+        )
+        assert criterion == asyncio.run(collect(images))
+
+
+def test_break():
+    text = get_long_text()
+    template = get_default_template()
+    criterion = list(handwrite(text, template, seed=SEED))[:2]
+    images = ahandwrite(text, template, seed=SEED)
+    assert criterion == asyncio.run(collect(images, limit=2))
+
+
+def test_null_text():
+    images = ahandwrite("", get_default_template())
+    assert asyncio.run(collect(images)) == []
@@ -1,6 +1,8 @@
 # coding: utf-8
 import copy
 
+import pytest
+
 import PIL.Image
 import PIL.ImageDraw
 
@@ -92,3 +94,224 @@ def test_line_separators():
             == list(handwrite(text5, template, seed=SEED))
             == list(handwrite(text6, template, seed=SEED))
             == list(handwrite(text7, template, seed=SEED)))
+
+
+def test_glyph_cache():
+    text = get_long_text()
+    template = get_default_template()
+    cache = GlyphCache()
+    images1 = list(handwrite(text, template, seed=SEED, glyph_cache=cache))
+    hits, misses, maxsize, currsize = cache.cache_info()
+    assert hits > 0 and misses == currsize > 0
+    images2 = handwrite(text, template, seed=SEED, glyph_cache=GlyphCache(0))
+    assert images1 == list(images2)
+
+
+def test_glyph_strokes():
+    text = get_long_text()
+    template = get_default_template()
+    template.set_features({Feature.GLYPH_STROKES})
+    template.set_font_size_sigma(0.3)
+    images1 = list(handwrite(text, template, seed=SEED))
+    images2 = list(handwrite(text, template, seed=SEED))
+    assert images1 == images2
+    images3 = handwrite(
+        text, template, seed=SEED, workers=2, shared_memory=True
+    )
+    assert list(images3) == images1
+
+
+def test_text_chunks():
+    text = get_long_text().replace("\n", "\r\n")
+    template = get_default_template()
+    criterion = list(handwrite(text, template, seed=SEED))
+    chunks = [text[i:i + 7] for i in range(0, len(text), 7)]
+    assert any(chunk.endswith("\r") for chunk in chunks)
+    assert criterion == list(handwrite(chunks, template, seed=SEED))
+    assert criterion == list(handwrite(iter(chunks), template, seed=SEED))
+
+
+def test_text_file():
+    import io
+    text = get_long_text()
+    template = get_default_template()
+    criterion = list(handwrite(text, template, seed=SEED))
+    with io.StringIO(text) as f:
+        assert criterion == list(handwrite(f, template, seed=SEED))
+
+
+def test_prefetch():
+    text = get_long_text()
+    template = get_default_template()
+    images1 = handwrite(text, template, seed=SEED)
+    images2 = handwrite(text, template, seed=SEED, prefetch=2)
+    assert list(images1) == list(images2)
+
+
+def test_stats():
+    text = get_long_text()
+    template = get_default_template()
+    template.set_font_size_sigma(0.3)
+    stats = []
+    images1 = handwrite(text, template, seed=SEED)
+    images2 = handwrite(text, template, seed=SEED, on_stats=stats.append)
+    images2 = list(images2)
+    assert list(images1) == images2
+    assert [s.num for s in stats] == list(range(len(images2)))
+    assert sum(s.chars for s in stats) == len(text.replace("\n", ""))
+    assert sum(s.strokes for s in stats) > 0
+    assert sum(s.ink_pixels for s in stats) > 0
+    assert sum(s.font_variants for s in stats) > 0
+    for s in stats:
+        assert s.layout_time >= 0
+        assert s.glyph_time >= 0
+        assert s.extraction_time >= 0
+        assert s.perturbation_time >= 0
+        assert s.background_time >= 0
+        assert s.merge_time >= 0
+    counters = [(s.chars, s.strokes, s.ink_pixels) for s in stats]
+
+    stats.clear()
+    images3 = handwrite(
+        text, template, seed=SEED, workers=2, on_stats=stats.append
+    )
+    assert list(images3) == images2
+    assert [(s.chars, s.strokes, s.ink_pixels) for s in stats] == counters
+
+
+def test_buffer_pool():
+    text = get_long_text()
+    template = get_default_template()
+    template.set_font_size_sigma(0.3)
+    criterion = list(handwrite(text, template, seed=SEED))
+    pool = BufferPool()
+    released = set()
+    for _ in range(2):
+        images = handwrite(text, template, seed=SEED, buffer_pool=pool)
+        for image, expected in zip(images, criterion):
+            assert image == expected
+            pool.release(image)
+            released.add(id(image))
+    reused = handwrite(text, template, seed=SEED, buffer_pool=pool)
+    assert id(next(reused)) in released
+
+
+def test_buffer_pool_with_palette():
+    text = get_long_text()
+    template = get_default_template()
+    template.set_background(PIL.Image.new("P", SIZE, color=3))
+    template.set_fill(7)
+    criterion = list(handwrite(text, template, seed=SEED))
+    pool = BufferPool()
+    for _ in range(2):
+        images = handwrite(text, template, seed=SEED, buffer_pool=pool)
+        for image, expected in zip(images, criterion):
+            assert image == expected
+            pool.release(image)
+
+
+def test_large_background():
+    template = Template(
+        background=PIL.Image.new(mode="1", size=(70000, 40), color=1),
+        font=get_default_font(30),
+    )
+    images = list(handwrite(get_short_text(), template))
+    assert len(images) == 1
+    assert images[0].getextrema()[0] == 0
+
+
+def test_tiles(monkeypatch):
+    import handright._core
+    text = get_long_text()
+    template = get_default_template()
+    criterion = list(handwrite(text, template, seed=SEED))
+    monkeypatch.setattr(handright._core, "_TILE_PIXELS", 50)
+    assert criterion == list(handwrite(text, template, seed=SEED))
+
+
+def test_compiled_template():
+    text = get_long_text()
+    template = get_default_template()
+    template.set_font_size_sigma(0.3)
+    criterion = list(handwrite(text, template, seed=SEED))
+    compiled = template.compile()
+    assert criterion == list(handwrite(text, compiled, seed=SEED))
+    assert criterion == list(handwrite(text, compiled, seed=SEED, workers=2))
+    assert criterion == list(handwrite(text, [compiled], seed=SEED))
+
+
+def test_parallel_drafting():
+    text = get_long_text()
+    template = get_default_template()
+    template.set_font_size_sigma(0.3)
+    template.set_line_spacing_sigma(0.3)
+    criterion = list(handwrite(text, template, seed=SEED))
+    images = handwrite(
+        text, template, seed=SEED, workers=2, parallel_drafting=True
+    )
+    assert list(images) == criterion
+
+    chunks = [text[i:i + 7] for i in range(0, len(text), 7)]
+    stats = []
+    images = handwrite(
+        iter(chunks), template, seed=SEED, workers=2, parallel_drafting=True,
+        prefetch=2, max_in_flight=3, on_stats=stats.append,
+    )
+    assert list(images) == criterion
+    assert [s.num for s in stats] == list(range(len(criterion)))
+    assert sum(s.chars for s in stats) == len(text.replace("\n", ""))
+
+    pairs = handwrite(
+        text, template, seed=SEED, workers=2, parallel_drafting=True,
+        ordered=False,
+    )
+    assert sorted(pairs, key=lambda p: p[0]) == list(enumerate(criterion))
+
+
+def test_ignored_options():
+    template = get_default_template()
+    for kwargs in (
+            {"parallel_drafting": True},
+            {"shared_memory": True},
+            {"max_in_flight": 2},
+            {"workers": 2, "parallel_drafting": True, "shared_memory": True},
+            {"workers": 2, "parallel_drafting": True,
+             "glyph_cache": GlyphCache()},
+            {"workers": 2, "parallel_drafting": True,
+             "buffer_pool": BufferPool()},
+    ):
+        with pytest.raises(ValueError):
+            handwrite("", template, **kwargs)
+    with pytest.raises(ValueError):
+        Session(template, max_in_flight=2)
+
+
+def test_max_in_flight():
+    text = get_long_text()
+    template = get_default_template()
+    criterion = list(handwrite(text, template, seed=SEED))
+    assert len(criterion) > 8
+    consumed = []
+
+    def chunks():
+        for char in text:
+            consumed.append(char)
+            yield char
+
+    images = handwrite(
+        chunks(), template, seed=SEED, workers=2, max_in_flight=2
+    )
+    assert next(images) == criterion[0]
+    assert len(consumed) < len(text)
+    assert list(images) == criterion[1:]
+
+
+def test_unordered():
+    text = get_long_text()
+    template = get_default_template()
+    criterion = list(handwrite(text, template, seed=SEED))
+    for kwargs in ({}, {"workers": 2}, {"workers": 2, "shared_memory": True}):
+        pairs = handwrite(text, template, seed=SEED, ordered=False, **kwargs)
+        pairs = list(pairs)
+        assert sorted(i for i, _ in pairs) == list(range(len(criterion)))
+        assert all(image == criterion[i] for i, image in pairs)
@@ -0,0 +1,119 @@
+# coding: utf-8
+import io
+
+import PIL.Image
+import pytest
+
+from handright import *
+from tests.util import *
+
+SIZE = (48, 48)
+SEED = "Handright"
+
+
+def get_default_templates():
+    template1 = Template(
+        background=PIL.Image.new(mode="RGB", size=SIZE, color="white"),
+        left_margin=3,
+        top_margin=6,
+        right_margin=3,
+        bottom_margin=6,
+        line_spacing=5,
+        font=get_default_font(4),
+        font_size_sigma=0.3,
+        word_spacing_sigma=0.3,
+        line_spacing_sigma=0.3,
+    )
+    template2 = Template(
+        background=PIL.Image.new(mode="L", size=SIZE, color="white"),
+        left_margin=5,
+        top_margin=4,
+        right_margin=2,
+        bottom_margin=9,
+        line_spacing=5,
+        font=get_default_font(4),
+        features={Feature.GRID_LAYOUT},
+    )
+    return template1, template2
+
+
+def get_text() -> str:
+    return get_long_text()[:800] + "\r\n\r\n" + get_short_text()
+
+
+def test_render_page():
+    text = get_text()
+    templates = get_default_templates()
+    criterion = list(handwrite(text, templates, seed=SEED))
+    index = PageIndex.build(text, templates, seed=SEED)
+    assert len(index) == len(criterion)
+    for num in (len(criterion) - 1, 0, 3, 4):
+        assert render_page(text, templates, index, num, SEED) == criterion[num]
+
+
+def test_render_pages():
+    text = get_text()
+    templates = get_default_templates()
+    criterion = list(handwrite(text, templates, seed=SEED))
+    index = PageIndex.build(text, templates, seed=SEED)
+    images = render_pages(text, templates, index, 3, 7, SEED)
+    assert list(images) == criterion[3:7]
+    images = render_pages(text, templates, index, 5, seed=SEED)
+    assert list(images) == criterion[5:]
+
+
+def test_save_and_load(tmp_path):
+    text = get_text()
+    templates = get_default_templates()
+    index = PageIndex.build(text, templates, seed=SEED)
+    index.save(tmp_path / "index.json")
+    assert PageIndex.load(tmp_path / "index.json") == index
+    f = io.StringIO()
+    index.save(f)
+    f.seek(0)
+    loaded = PageIndex.load(f)
+    assert loaded == index
+    num = len(index) - 2
+    image = render_page(text, templates, loaded, num, SEED)
+    assert image == list(handwrite(text, templates, seed=SEED))[num]
+
+
+def test_errors():
+    text = get_text()
+    templates = get_default_templates()
+    index = PageIndex.build(text, templates, seed=SEED)
+    with pytest.raises(ValueError):
+        render_page(text + "我", templates, index, 0, SEED)
+    with pytest.raises(ValueError):
+        render_page(text, templates, index, 0, SEED + "!")
+    with pytest.raises(ValueError):
+        render_page(text, templates[::-1], index, 0, SEED)
+    templates[0].set_word_spacing(1)
+    with pytest.raises(ValueError):
+        render_page(text, templates, index, 0, SEED)
+    with pytest.raises(IndexError):
+        render_page(text, get_default_templates(), index, len(index), SEED)
+    assert len(PageIndex.build("", templates)) == 0
+
+
+def test_without_seed():
+    text = get_text()
+    templates = get_default_templates()
+    for template in templates:
+        template.set_perturb_x_sigma(0)
+        template.set_perturb_y_sigma(0)
+        template.set_perturb_theta_sigma(0)
+    index = PageIndex.build(text, templates)
+    num = len(index) - 1
+    image = render_page(text, templates, index, num)
+    images = render_pages(text, templates, index, 0)
+    assert list(images)[num] == image
+
+
+def test_compact():
+    text = get_text()
+    templates = get_default_templates()
+    index = PageIndex.build(text, templates, seed=SEED)
+    f = io.StringIO()
+    index.save(f)
+    assert len(f.getvalue()) < 512 + 64 * len(index)
@@ -0,0 +1,80 @@
+# coding: utf-8
+import random
+
+import PIL.Image
+
+from handright import *
+from tests.util import *
+
+SIZE = (48, 48)
+SEED = "Handright"
+
+
+def get_default_template(sigma: float) -> Template:
+    return Template(
+        background=PIL.Image.new(mode="RGB", size=SIZE, color="white"),
+        left_margin=3,
+        top_margin=6,
+        right_margin=3,
+        bottom_margin=6,
+        line_spacing=5,
+        font=get_default_font(4),
+        font_size_sigma=sigma,
+        word_spacing_sigma=sigma,
+        line_spacing_sigma=sigma,
+        start_chars="“（",
+    )
+
+
+def check(manuscript, text, template):
+    images = manuscript.handwrite(text)
+    assert images == list(handwrite(text, template, seed=SEED))
+    return images
+
+
+def get_page_start(text, template, num) -> int:
+    return list(paginate(text, template, seed=SEED))[num].start
+
+
+def test_edits():
+    rand = random.Random(SEED)
+    text = get_long_text()[:600]
+    for sigma in (0, 0.3):
+        template = get_default_template(sigma)
+        manuscript = Manuscript(template, seed=SEED)
+        check(manuscript, text, template)
+        for _ in range(12):
+            i = rand.randrange(len(text))
+            j = rand.randrange(i, min(i + 20, len(text)) + 1)
+            text = text[:i] + get_short_text()[:rand.randrange(5)] + text[j:]
+            check(manuscript, text, template)
+        check(manuscript, "", template)
+        check(manuscript, text + "\r\n", template)
+
+
+def test_reuse():
+    text = get_long_text()[:600]
+    for sigma in (0, 0.3):
+        template = get_default_template(sigma)
+        manuscript = Manuscript(template, seed=SEED)
+        old_images = check(manuscript, text, template)
+        assert len(old_images) > 4
+        # replace a char on the second page
+        index = get_page_start(text, template, 1) + 3
+        text = text[:index] + "我" + text[index + 1:]
+        new_images = check(manuscript, text, template)
+        assert new_images[0] is old_images[0]
+        assert new_images[-1] is old_images[-1]
+        # append to the last page
+        old_images = new_images
+        new_images = check(manuscript, text + "我", template)
+        assert all(a is b for a, b in zip(new_images[:-2], old_images))
+
+
+def test_same_text():
+    text = get_long_text()[:200]
+    template = get_default_template(0.3)
+    manuscript = Manuscript(template, seed=SEED)
+    images = manuscript.handwrite(text)
+    assert all(a is b for a, b in zip(manuscript.handwrite(text), images))
+    assert manuscript.get_text() == text
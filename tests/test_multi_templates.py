@@ -142,3 +142,61 @@ def test_rgb_image():
     # Test by human beings' naked eyes.
     # Please run watch.py
     pass
+
+
+def test_workers():
+    text = get_long_text()
+    templates = get_default_templates()
+    images1 = handwrite(text, templates, seed=SEED)
+    images2 = handwrite(text, templates, seed=SEED, workers=2)
+    assert list(images1) == list(images2)
+
+
+def test_shared_memory():
+    text = get_long_text()
+    templates = get_default_templates()
+    templates[1].set_background(PIL.Image.new("P", SIZE, color=3))
+    templates[1].set_fill(7)
+    templates[0].set_features({Feature.GLYPH_STROKES})
+    images1 = handwrite(text, templates, seed=SEED)
+    images2 = handwrite(
+        text, templates, seed=SEED, workers=2, shared_memory=True
+    )
+    assert list(images1) == list(images2)
+
+
+def get_jobs(templates) -> List[tuple]:
+    return [
+        (get_long_text(), templates, SEED),
+        (get_short_text(), templates[1], 1),
+        ("", templates[0], 2),
+        (get_long_text(), templates[::-1], SEED),
+        (get_short_text(), templates, None),
+    ]
+
+
+def check_handwrite_many(**kwargs):
+    templates = get_default_templates()
+    jobs = get_jobs(templates)
+    criterion = [
+        (job_id, page_index, image)
+        for job_id, (text, template, seed) in enumerate(jobs[:-1])
+        for page_index, image in enumerate(handwrite(text, template, seed))
+    ]
+    results = list(handwrite_many(jobs, **kwargs))
+    assert results[:len(criterion)] == criterion
+    tags = [(job_id, page_index) for job_id, page_index, _ in results]
+    num_pages = len(list(handwrite(get_short_text(), templates)))
+    assert tags[len(criterion):] == [(4, i) for i in range(num_pages)]
+
+
+def test_handwrite_many():
+    check_handwrite_many()
+
+
+def test_handwrite_many_workers():
+    check_handwrite_many(workers=2)
+
+
+def test_handwrite_many_shared_memory():
+    check_handwrite_many(workers=2, shared_memory=True)
@@ -0,0 +1,87 @@
+# coding: utf-8
+import PIL.Image
+import pytest
+
+from handright import *
+from tests.util import *
+
+SIZE = (64, 64)
+SEED = "Handright"
+
+
+def get_default_templates():
+    template1 = Template(
+        background=PIL.Image.new(mode="RGB", size=SIZE, color="white"),
+        left_margin=3,
+        top_margin=6,
+        right_margin=3,
+        bottom_margin=6,
+        line_spacing=6,
+        font=get_default_font(5),
+        font_size_sigma=0.5,
+        word_spacing_sigma=0.5,
+        line_spacing_sigma=0.5,
+        start_chars="“（",
+    )
+    template2 = Template(
+        background=PIL.Image.new(mode="L", size=SIZE, color="white"),
+        left_margin=5,
+        top_margin=4,
+        right_margin=2,
+        bottom_margin=9,
+        line_spacing=5,
+        font=get_default_font(4),
+        features={Feature.GRID_LAYOUT},
+    )
+    return template1, template2
+
+
+def count_chars(text: str) -> int:
+    return len(text.replace("\n", ""))
+
+
+def test_consistency():
+    text = get_long_text() + "\r\n\r\n" + get_short_text()
+    templates = get_default_templates()
+    stats = []
+    images = list(handwrite(text, templates, SEED, on_stats=stats.append))
+    layouts = list(paginate(text, templates, SEED))
+    assert len(layouts) == len(images)
+    text = text.replace("\r\n", "\n")
+    for layout, s in zip(layouts, stats):
+        assert layout.num == s.num
+        assert count_chars(text[layout.start:layout.end]) == s.chars
+
+
+def test_ranges():
+    text = get_long_text()
+    layouts = list(paginate(text, get_default_templates(), SEED))
+    assert layouts[0].start == 0
+    assert layouts[-1].end == len(text)
+    for layout1, layout2 in zip(layouts, layouts[1:]):
+        assert layout1.end == layout2.start
+    for layout in layouts:
+        assert layout.lines[0][0] == layout.start
+        assert layout.lines[-1][1] == layout.end
+        for line1, line2 in zip(layout.lines, layout.lines[1:]):
+            assert line1[1] == line2[0]
+            assert line1[2] < line2[2]
+
+
+def test_seed():
+    text = get_long_text()
+    templates = get_default_templates()
+    layouts1 = list(paginate(text, templates, SEED))
+    layouts2 = list(paginate(text, templates, SEED))
+    assert layouts1 == layouts2
+
+
+def test_null_text():
+    assert list(paginate("", get_default_templates())) == []
+
+
+def test_layout_error():
+    template = get_default_templates()[0]
+    template.set_line_spacing(4)
+    with pytest.raises(LayoutError):
+        list(paginate(get_short_text(), template))
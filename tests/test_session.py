@@ -0,0 +1,82 @@
+# coding: utf-8
+import PIL.Image
+
+from handright import *
+from tests.util import *
+
+SIZE = (32, 32)
+SEED = "Handright"
+
+
+def get_default_template() -> Template:
+    return Template(
+        background=PIL.Image.new(mode="RGB", size=SIZE, color="white"),
+        left_margin=3,
+        top_margin=6,
+        right_margin=3,
+        bottom_margin=6,
+        line_spacing=2,
+        font=get_default_font(2),
+    )
+
+
+def test_handwrite():
+    text = get_long_text()
+    template = get_default_template()
+    with Session(template) as session:
+        for seed in (0, SEED):
+            images1 = handwrite(text, template, seed=seed)
+            images2 = session.handwrite(text, seed=seed)
+            assert list(images1) == list(images2)
+
+
+def test_workers():
+    text = get_long_text()
+    template = get_default_template()
+    with Session(template, workers=2) as session:
+        for seed in (0, SEED):
+            images1 = handwrite(text, template, seed=seed)
+            images2 = session.handwrite(text, seed=seed)
+            assert list(images1) == list(images2)
+
+
+def test_unordered():
+    text = get_long_text()
+    template = get_default_template()
+    criterion = list(handwrite(text, template, seed=SEED))
+    with Session(template, workers=2, max_in_flight=3) as session:
+        pairs = dict(session.handwrite(text, seed=SEED, ordered=False))
+        assert [pairs[i] for i in range(len(pairs))] == criterion
+        assert list(session.handwrite(text, seed=SEED)) == criterion
+
+
+def test_buffer_pool():
+    text = get_long_text()
+    template = get_default_template()
+    pool = BufferPool()
+    for workers in (None, 2):
+        with Session(template, workers, buffer_pool=pool) as session:
+            for seed in (0, SEED, SEED):
+                images = session.handwrite(text, seed=seed)
+                criterion = handwrite(text, template, seed=seed)
+                for image1, image2 in zip(criterion, images):
+                    assert image1 == image2
+                    pool.release(image2)
+
+
+def test_glyph_cache():
+    text = get_short_text()
+    with Session(get_default_template()) as session:
+        list(session.handwrite(text))
+        misses = session.glyph_cache().cache_info().misses
+        list(session.handwrite(text))
+        assert session.glyph_cache().cache_info().misses == misses
+
+
+def test_templates_copied():
+    text = get_long_text()
+    template = get_default_template()
+    criterion = list(handwrite(text, template, seed=SEED))
+    with Session(template) as session:
+        template.set_left_margin(5)
+        assert criterion == list(session.handwrite(text, seed=SEED))
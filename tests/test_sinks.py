@@ -0,0 +1,98 @@
+# coding: utf-8
+import gc
+import io
+import os
+import weakref
+
+import PIL.Image
+import PIL.PdfParser
+
+from handright import *
+from tests.util import *
+
+SIZE = (48, 64)
+SEED = "Handright"
+
+
+def get_images():
+    template = Template(
+        background=PIL.Image.new(mode="RGB", size=SIZE, color="white"),
+        left_margin=3,
+        top_margin=6,
+        right_margin=3,
+        bottom_margin=6,
+        line_spacing=5,
+        font=get_default_font(4),
+    )
+    images = list(handwrite(get_long_text()[:300], template, seed=SEED))
+    images.append(PIL.Image.new("1", (33, 20), 1))
+    images.append(PIL.Image.new("L", (20, 33), 7))
+    images.append(PIL.Image.new("RGBA", (9, 9), (1, 2, 3, 4)))
+    return images
+
+
+def test_save_pdf(tmp_path):
+    images = get_images()
+    path = tmp_path / "pages.pdf"
+    count = save_pdf(iter(images), path, resolution=144, workers=2)
+    assert count == len(images)
+    pdf = PIL.PdfParser.PdfParser(str(path))
+    try:
+        assert len(pdf.pages) == len(images)
+        for ref, image in zip(pdf.pages, images):
+            page = pdf.read_indirect(ref)
+            width, height = page[b"MediaBox"][2:]
+            assert (round(width * 2), round(height * 2)) == image.size
+            stream = pdf.read_indirect(page[b"Resources"][b"XObject"][b"Im"])
+            if image.mode == "1":
+                assert stream.decode() == image.tobytes()
+            else:
+                decoded = PIL.Image.open(io.BytesIO(bytes(stream.buf)))
+                assert decoded.size == image.size
+    finally:
+        pdf.close()
+
+
+def test_save_pdf_file_object():
+    images = get_images()
+    f = io.BytesIO()
+    assert save_pdf(images, f) == len(images)
+    assert f.getvalue().startswith(b"%PDF-")
+    assert f.getvalue().endswith(b"%%EOF\n")
+
+
+def test_save_tiff(tmp_path):
+    images = get_images()
+    path = tmp_path / "pages.tiff"
+    count = save_tiff(iter(images), path, compression="tiff_deflate")
+    assert count == len(images)
+    with PIL.Image.open(path) as tiff:
+        assert tiff.n_frames == len(images)
+        for i, image in enumerate(images):
+            tiff.seek(i)
+            assert visually_equal(tiff, image)
+
+
+def test_save_pngs(tmp_path):
+    images = get_images()
+    directory = tmp_path / "pages"
+    assert save_pngs(iter(images), directory, name="p{}.png") == len(images)
+    assert len(os.listdir(directory)) == len(images)
+    for i, image in enumerate(images):
+        with PIL.Image.open(directory / "p{}.png".format(i)) as png:
+            assert visually_equal(png, image)
+
+
+def test_streaming(tmp_path):
+    workers = 2
+    refs = []
+
+    def produce():
+        for i in range(40):
+            gc.collect()
+            assert sum(r() is not None for r in refs) <= 2 * workers + 1
+            image = PIL.Image.new("RGB", SIZE, (i, i, i))
+            refs.append(weakref.ref(image))
+            yield image
+
+    assert save_pngs(produce(), tmp_path, workers=workers) == 40
@@ -3,6 +3,7 @@ import pickle
 
 import PIL.Image
 import PIL.ImageFont
+import pytest
 
 from handright._template import *
 from tests.util import *
@@ -31,3 +32,63 @@ def test_release_font_resource():
     template = build_template()
     template.release_font_resource()
     pickle.dumps(template)
+
+
+def test_get_font_variant():
+    template = build_template()
+    font = template.get_font()
+    assert template.get_font_variant(font.size) is font
+    variant = template.get_font_variant(font.size + 1)
+    assert variant.size == font.size + 1
+    assert template.get_font_variant(font.size + 1) is variant
+    template.set_font(get_default_font(9))
+    assert template.get_font_variant(font.size + 1) is not variant
+
+
+def test_pickle_font_variants():
+    template = build_template()
+    template.get_font_variant(9)
+    template.release_font_resource()
+    pickle.loads(pickle.dumps(template))
+
+
+def test_compile():
+    template = build_template()
+    compiled = template.compile()
+    assert compiled.background is template.get_background()
+    assert compiled.font is template.get_font()
+    assert compiled.font_size == 8
+    assert compiled.size == (2, 2)
+    assert compiled.features == frozenset()
+    with pytest.raises(AttributeError):
+        compiled.fill = 0
+    template.set_word_spacing(3)
+    assert compiled.word_spacing == 0
+
+
+def test_compiled_digest():
+    template = build_template()
+    compiled = template.compile()
+    assert compiled == template.compile()
+    assert hash(compiled) == hash(template.compile())
+    assert compiled in {template.compile()}
+    template.set_line_spacing_sigma(0)
+    assert compiled != template.compile()
+    template = build_template()
+    template.get_background().putpixel((0, 0), 0)
+    assert compiled != template.compile()
+    template = build_template()
+    template.set_font(get_default_font(9))
+    assert compiled != template.compile()
+
+
+def test_pickle_compiled_template():
+    compiled = build_template().compile()
+    compiled.get_font_variant(9)
+    data = pickle.dumps(compiled)
+    assert len(data) < 1024
+    restored = pickle.loads(data)
+    assert restored == compiled
+    assert restored.digest() == compiled.digest()
+    assert restored.font.size == compiled.font_size
+    assert restored.get_font_variant(9).size == 9